@@ -37,6 +37,8 @@ ANYMAIL = {
 # set this to the PK of the event you want the site to be active for.
 #  If None, defaults to the event with the latest start date.
 CURRENT_EVENT_ID = None
+# how long each process may reuse the current event before reloading it.
+CURRENT_EVENT_CACHE_SECONDS = 60
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.environ.get("DEBUG", False)
@@ -71,7 +73,9 @@ INSTALLED_APPS = (
 
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
 
-MIDDLEWARE_CLASSES = (
+MIDDLEWARE = (
+    # first, so it counts everything below it.
+    'camp.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -82,6 +86,24 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.security.SecurityMiddleware',
 )
 
+# per-request query and render timings from camp.instrumentation go to
+# stdout, where heroku collects them.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'camp': {
+            'handlers': ['console'],
+            'level': os.environ.get('CAMP_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
 if not DEBUG:
     SECURE_HSTS_SECONDS = 10
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
@@ -136,6 +158,8 @@ if not db_config:
     db_config = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # a file, not memory, so tests' threads share the test database.
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 else:
     db_config['CONN_MAX_AGE'] = 500
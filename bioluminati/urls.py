@@ -36,12 +36,14 @@ urlpatterns = [
     url(r'^profile/', views.profile, name='profile'),
     url(r'^vehicle/', views.vehicle, name='vehicle'),
     url(r'^shelter/', views.shelter, name='shelter'),
+    url(r'^providers/(?P<kind>[^/]+)/$', views.provider_search, name='provider_search'),
 
     # chef signup
     url(r'^meal_shifts/$', views.meal_shifts, name='meal_shifts'),
     url(r'^chef_signup/(?P<meal_id>[^/]+)/$', views.chef_signup, name='chef_signup'),
     url(r'^chef_requirements/(?P<meal_id>[^/]+)/$', views.chef_requirements, name='chef_requirements'),
     url(r'^worker_signup/(?P<shift_id>[^/]+)/$', views.worker_signup, name='worker_signup'),
+    url(r'^claim_shifts/$', views.claim_shifts, name='claim_shifts'),
     url(r'^bikes/$', views.show_bike_form, name='bikes'),
     url(r'^bikes/(?P<bike_id>[^/]+)/edit/$', views.edit_bike, name='edit_bike'),
     url(r'^remove-bike-from-db/', views.remove_bike, name='remove_bike'),
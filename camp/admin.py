@@ -23,6 +23,10 @@ class BikeMutationScheduleAdmin(admin.ModelAdmin):
     list_filter = ('event',)
 
 
+class VehicleAdmin(admin.ModelAdmin):
+    list_filter = ('event', 'transit_arrangement')
+
+
 admin.site.register(Meal, MealAdmin)
 admin.site.register(MealShift)
 admin.site.register(User, UserAdmin)
@@ -32,7 +36,7 @@ admin.site.register(Inventory)
 admin.site.register(BicycleMutationInventory)
 admin.site.register(MealRestriction)
 admin.site.register(BikeMutationSchedule, BikeMutationScheduleAdmin)
-admin.site.register(Vehicle)
+admin.site.register(Vehicle, VehicleAdmin)
 
 
 class CustomFlatPageAdmin(FlatPageAdmin):
@@ -0,0 +1,10 @@
+from __future__ import absolute_import
+
+from django.apps import AppConfig
+
+
+class CampConfig(AppConfig):
+    name = 'camp'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,218 @@
+from __future__ import absolute_import
+
+import json
+import math
+import time
+from collections import OrderedDict
+from cStringIO import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .models import BikeMutationSchedule, Meal, MealShift, User, UserAttendance
+from .shortcuts import clear_event_cache
+
+# (name, url name, query string) of each page benchmarked.
+VIEWS = [
+    ('calendar', 'calendar', {}),
+    ('meal_schedule', 'meal_schedule', {}),
+    ('meal_shifts', 'meal_shifts', {}),
+    ('campers', 'campers', {}),
+    ('export', 'export', {}),
+]
+
+STATS = ('p50_ms', 'p95_ms', 'queries')
+
+# Each view is measured with the cache cleared before every request, and
+# again with it warm, since the cached pages answer very differently.
+CACHE_MODES = ('cold', 'warm')
+
+# Latency differences smaller than this are noise, whatever the ratio.
+MIN_REGRESSION_MS = 25
+
+# Fewer timed requests than this give percentiles too rough to gate on, so
+# latency is then reported but not compared.
+MIN_TIMED_REPEAT = 10
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    """
+    The nearest-rank percentile of some values.
+    """
+    values = sorted(values)
+    rank = int(math.ceil(fraction * len(values)))
+    return values[max(rank, 1) - 1]
+
+def _get(client, url, data):
+    response = client.get(url, data)
+    if response.status_code != 200:
+        raise BenchmarkError("%s answered %s" % (url, response.status_code))
+    if response.streaming:
+        b''.join(response.streaming_content)
+
+def measure(client, url, data=None, repeat=20, cold=False):
+    """
+    Time repeated GETs of a page, once warmed up. Queries are counted
+    while the whole response is read, since streamed pages query as they
+    go. With cold, the cache is cleared before each request.
+    """
+    data = data or {}
+    _get(client, url, data)
+
+    timings = []
+    queries = []
+    for i in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.time()
+            _get(client, url, data)
+            timings.append(time.time() - start)
+        queries.append(len(ctx))
+
+    return {
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 1),
+        'queries': max(queries),
+    }
+
+def run(sizes, repeat=20, seed=0, log=None):
+    """
+    Benchmark every view against a synthetic camp of each size, returning
+    {size: {view: {cache mode: stats}}}. Empties the database before each
+    size, so only run it against a test database.
+    """
+    results = {}
+    for size in sizes:
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        clear_event_cache()
+        call_command('generate_camp', campers=size, seed=seed,
+            stdout=log or StringIO())
+
+        # staff, so every view answers.
+        user = User.objects.order_by('pk').first()
+        user.is_staff = True
+        user.save()
+        client = Client()
+        client.force_login(user)
+
+        results[str(size)] = {}
+        for name, url_name, data in VIEWS:
+            results[str(size)][name] = {mode: measure(client,
+                    reverse(url_name), data, repeat, cold=mode == 'cold')
+                for mode in CACHE_MODES}
+    return results
+
+def compare(results, baseline, threshold, repeat=MIN_TIMED_REPEAT):
+    """
+    Regressions of results against a baseline, as messages. Query counts
+    may not grow at all; latency may grow by the threshold, a fraction of
+    the baseline, and is only compared with at least MIN_TIMED_REPEAT
+    timed requests per view.
+    """
+    timed = repeat >= MIN_TIMED_REPEAT
+
+    regressions = []
+    for size, views in sorted(results.items(), key=lambda item: int(item[0])):
+        for name, modes in sorted(views.items()):
+            for mode in CACHE_MODES:
+                base = baseline.get(size, {}).get(name, {}).get(mode)
+                if base is None:
+                    continue
+                for stat in STATS:
+                    was, now = base.get(stat), modes[mode][stat]
+                    if stat == 'queries':
+                        regressed = now > was
+                    elif not timed or was is None:
+                        continue
+                    else:
+                        regressed = (now > was * (1 + threshold)
+                            and now - was >= MIN_REGRESSION_MS)
+                    if regressed:
+                        regressions.append("%s (%s) at %s campers: %s went "
+                            "from %s to %s" % (name, mode, size, stat, was, now))
+    return regressions
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True, separators=(',', ': '))
+        f.write('\n')
+
+
+# The models given composite indexes for the filters below.
+INDEXED_MODELS = (UserAttendance, Meal, BikeMutationSchedule)
+
+def hot_queries(event):
+    """
+    The filters and orderings the views lean on, as (name, queryset).
+    """
+    meal_ids = list(Meal.objects.filter(event=event).values_list('pk', flat=True))
+    return [
+        ('attendees', UserAttendance.objects.attendees(event).filter(
+            arrival_date__isnull=False, departure_date__isnull=False
+            ).values_list('user', 'arrival_date', 'departure_date')),
+        ('meals', Meal.objects.filter(event=event).order_by('day', 'kind')),
+        ('meal_shifts', MealShift.objects.filter(meal__in=meal_ids)),
+        ('meal_roles', MealShift.objects.filter(meal=meal_ids[0],
+            role__in=[MealShift.Sous_Chef, MealShift.KP]).order_by('pk')),
+        ('bike_shifts', BikeMutationSchedule.objects.filter(event=event,
+            worker__isnull=False)),
+        ('bike_schedule', BikeMutationSchedule.objects.filter(event=event
+            ).order_by('date', '-shift', 'id')),
+    ]
+
+def explain(queryset):
+    """
+    The database's plan for a queryset, a line per step.
+    """
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # sqlite's last column is the step; postgres has only the one.
+        return [row[-1] for row in cursor.fetchall()]
+
+def plans(event, repeat=20):
+    """
+    {name: {'plan': [...], 'p50_ms': ...}} of each hot query in order, with
+    fresh planner statistics.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    results = OrderedDict()
+    for name, queryset in hot_queries(event):
+        timings = []
+        for i in range(repeat):
+            start = time.time()
+            list(queryset.all())
+            timings.append(time.time() - start)
+        results[name] = {'plan': explain(queryset),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2)}
+    return results
+
+def drop_indexes():
+    """
+    Drop the INDEXED_MODELS' composite indexes, to see the plans without
+    them. For throwaway databases only: the migrations still think they
+    are there.
+    """
+    with connection.schema_editor() as editor:
+        for model in INDEXED_MODELS:
+            editor.alter_index_together(model, model._meta.index_together, ())
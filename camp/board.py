@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template import loader
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .forms import ChefForm
+from .models import Meal, MealShift
+from .versions import cache_key, request_data_version
+
+# How a slot on the shift board looks to the person viewing it. A meal's
+# chef sees every shift of it as CHEF, with who is working it.
+CHEF = 'chef'
+MINE = 'mine'
+OTHER = 'other'
+OPEN = 'open'
+
+# Everything on the board but the chef's requirements form is the same for
+# every viewer, so each meal is rendered once with every variant of its
+# slots and cached under the event's data version. Any change to the event
+# bumps that version in the database, so every process stops reading the
+# old cards at once.
+MEAL_BOARD_CACHE_SECONDS = 60 * 60
+
+# cached forms carry this in place of the viewer's csrf token.
+CSRF_PLACEHOLDER = 'meal-board-csrf-token'
+
+
+def holder_state(holder_id, viewer):
+    if holder_id is None:
+        return OPEN
+    return MINE if holder_id == viewer.id else OTHER
+
+
+def _render(template_name, context):
+    context['csrf_token'] = CSRF_PLACEHOLDER
+    return loader.get_template(template_name).render(context)
+
+def render_card(meal):
+    """
+    A meal's board as every viewer could see it: its chef slot and each
+    non-chef shift rendered once per state it can be in for a viewer.
+    Reads meal.chef and meal.shifts.all(), so select and prefetch them.
+    """
+    chef = {}
+    if meal.chef_id:
+        chef[OTHER] = _render('meals/chef_bio.html', {'meal': meal})
+    else:
+        chef[OPEN] = _render('meals/chef_signup.html', {'meal': meal})
+
+    shifts = []
+    for shift in meal.shifts.all():
+        if shift.role == MealShift.Chef:
+            continue
+        html = {CHEF: _render('meals/worker_bio.html', {'shift': shift})}
+        if shift.worker_id:
+            html[MINE] = _render('meals/worker_quit.html', {'shift': shift})
+            html[OTHER] = _render('meals/worker_other.html', {'shift': shift})
+        else:
+            html[OPEN] = _render('meals/worker_signup.html', {'shift': shift})
+        shifts.append((shift.worker_id, html))
+
+    return {'pk': meal.pk, 'day': meal.day, 'kind': meal.kind,
+        'chef_id': meal.chef_id, 'chef': chef, 'shifts': shifts}
+
+def meal_cards(event, version):
+    """
+    Cards for every meal of an event in day and kind order, as of a data
+    version of it, rendering and caching only the ones missing from the
+    cache.
+    """
+    def _meal_key(meal_id):
+        return cache_key(event, version, 'meal_board', meal_id)
+
+    key = cache_key(event, version, 'meal_board')
+    meal_ids = cache.get(key)
+    if meal_ids is None:
+        meal_ids = list(Meal.objects.filter(event=event
+            ).values_list('pk', flat=True))
+        cache.set(key, meal_ids, MEAL_BOARD_CACHE_SECONDS)
+
+    cards = cache.get_many([_meal_key(pk) for pk in meal_ids])
+    missing = [pk for pk in meal_ids if _meal_key(pk) not in cards]
+    if missing:
+        fresh = {_meal_key(meal.pk): render_card(meal)
+            for meal in Meal.objects.filter(pk__in=missing
+                ).select_related('chef').prefetch_related('shifts__worker')}
+        cache.set_many(fresh, MEAL_BOARD_CACHE_SECONDS)
+        cards.update(fresh)
+
+    return [cards[_meal_key(pk)] for pk in meal_ids if _meal_key(pk) in cards]
+
+def board(event, request):
+    """
+    The shift board for request.user: each meal's day, kind, and the html
+    of its chef slot and shifts as they look to that viewer.
+    """
+    viewer = request.user
+    token = get_token(request)
+    version, changed = request_data_version(request)
+    cards = meal_cards(event, version)
+
+    # only the chef's own meals need the database, for the requirements form.
+    cheffing = Meal.objects.filter(pk__in=[card['pk'] for card in cards
+        if card['chef_id'] == viewer.id]).prefetch_related('shifts')
+    chef_forms = {meal.pk: render_to_string('meals/chef_requirements.html',
+        {'meal': meal, 'form': ChefForm.for_meal(meal)}, request=request)
+        for meal in cheffing}
+
+    entries = []
+    for card in cards:
+        chef = holder_state(card['chef_id'], viewer)
+        if chef == MINE:
+            chef_html = chef_forms.get(card['pk'], '')
+            shift_states = [(CHEF, html) for worker_id, html in card['shifts']]
+        else:
+            chef_html = card['chef'][chef]
+            shift_states = [(holder_state(worker_id, viewer), html)
+                for worker_id, html in card['shifts']]
+
+        entries.append({
+            'day': card['day'],
+            'kind': card['kind'],
+            'chef': chef,
+            'chef_html': mark_safe(chef_html.replace(CSRF_PLACEHOLDER, token)),
+            'shifts': [(state, mark_safe(html[state].replace(CSRF_PLACEHOLDER, token)))
+                for state, html in shift_states],
+        })
+    return entries
@@ -0,0 +1,170 @@
+from __future__ import absolute_import
+
+from django.db import IntegrityError
+from django.db.transaction import atomic
+
+from . import versions
+from .models import Meal, MealShift, BikeMutationSchedule
+
+CLAIMED = 'claimed'
+RELEASED = 'released'
+# someone else got there first.
+TAKEN = 'taken'
+# you already work another shift at that meal.
+ALREADY_WORKING = 'already-working'
+NOT_YOURS = 'not-yours'
+NOT_FOUND = 'not-found'
+
+# Claims are single conditional UPDATEs: a claim only matches a row nobody
+# holds and a release only matches a row you hold, so the affected row
+# count says whether it worked and concurrent signups can't overwrite each
+# other. Claims and releases are separate actions rather than toggles, so a
+# stale page asking again for what it already did changes nothing.
+
+
+def _claim(qs, pk, field, user):
+    try:
+        with atomic():
+            claimed = qs.filter(pk=pk, **{field + '__isnull': True}
+                ).update(**{field: user})
+    except IntegrityError:
+        return ALREADY_WORKING
+    if claimed:
+        return CLAIMED
+    holders = list(qs.filter(pk=pk).values_list(field, flat=True))
+    if not holders:
+        return NOT_FOUND
+    # already yours, from an earlier click.
+    return CLAIMED if holders[0] == user.pk else TAKEN
+
+def _release(qs, pk, field, user):
+    if qs.filter(pk=pk, **{field: user}).update(**{field: None}):
+        return RELEASED
+    return NOT_YOURS if qs.filter(pk=pk).exists() else NOT_FOUND
+
+# updates don't send save signals, so the data versions are told directly.
+def _shifts_changed(results):
+    changed = [pk for pk, result in results.items()
+        if result in (CLAIMED, RELEASED)]
+    if changed:
+        meal_ids = set(MealShift.objects.filter(pk__in=changed
+            ).values_list('meal', flat=True))
+        versions.data_changed(meal_ids=meal_ids)
+    return results
+
+def _bike_shifts_changed(results):
+    changed = [pk for pk, result in results.items()
+        if result in (CLAIMED, RELEASED)]
+    if changed:
+        versions.data_changed(BikeMutationSchedule.objects.filter(
+            pk__in=changed).values_list('event', flat=True))
+    return results
+
+def claim_meal_shift(shift_id, user):
+    result = _claim(MealShift.objects.all(), shift_id, 'worker', user)
+    return _shifts_changed({shift_id: result})[shift_id]
+
+def release_meal_shift(shift_id, user):
+    result = _release(MealShift.objects.all(), shift_id, 'worker', user)
+    return _shifts_changed({shift_id: result})[shift_id]
+
+def claim_bike_shift(shift_id, user):
+    result = _claim(BikeMutationSchedule.objects.all(), shift_id, 'worker', user)
+    return _bike_shifts_changed({shift_id: result})[shift_id]
+
+def release_bike_shift(shift_id, user):
+    result = _release(BikeMutationSchedule.objects.all(), shift_id, 'worker', user)
+    return _bike_shifts_changed({shift_id: result})[shift_id]
+
+def _chef_changed(meal_id, result):
+    if result in (CLAIMED, RELEASED):
+        versions.data_changed(meal_ids=[meal_id])
+    return result
+
+def claim_chef(meal_id, user):
+    return _chef_changed(meal_id, _claim(Meal.objects.all(), meal_id, 'chef', user))
+
+def release_chef(meal_id, user):
+    return _chef_changed(meal_id, _release(Meal.objects.all(), meal_id, 'chef', user))
+
+
+def _claim_batch(qs, field, user, claim_ids, release_ids, one_per=None):
+    """
+    Release and then claim many rows of one model with a handful of set-based
+    queries, returning a result per requested pk.
+
+    one_per names a field the holder may only appear once under, the way a
+    camper works at most one shift per meal. Of several free rows under the
+    same value only the lowest pk is claimed.
+    """
+    null = {field + '__isnull': True}
+
+    held = set(qs.filter(pk__in=release_ids, **{field: user}
+        ).values_list('pk', flat=True))
+    if held:
+        qs.filter(pk__in=held, **{field: user}).update(**{field: None})
+
+    wanted = sorted(claim_ids)
+    if one_per is not None and wanted:
+        groups = dict(qs.filter(pk__in=wanted, **null
+            ).values_list('pk', one_per))
+        busy = set(qs.filter(**{field: user, one_per + '__in': set(groups.values())}
+            ).values_list(one_per, flat=True))
+        wanted = []
+        for pk in sorted(groups):
+            if groups[pk] not in busy:
+                busy.add(groups[pk])
+                wanted.append(pk)
+
+    if wanted:
+        try:
+            with atomic():
+                qs.filter(pk__in=wanted, **null).update(**{field: user})
+        except IntegrityError:
+            # a concurrent request claimed under one of the same groups.
+            for pk in wanted:
+                _claim(qs, pk, field, user)
+
+    columns = ['pk', field] + ([one_per] if one_per else [])
+    rows = {row[0]: row[1:] for row in qs.filter(
+        pk__in=set(claim_ids) | set(release_ids)).values_list(*columns)}
+    working = set()
+    if one_per is not None:
+        working = set(qs.filter(**{field: user, one_per + '__in':
+            set(row[1] for row in rows.values())}
+            ).values_list(one_per, flat=True))
+
+    results = {}
+    for pk in release_ids:
+        if pk in held:
+            results[pk] = RELEASED
+        else:
+            results[pk] = NOT_YOURS if pk in rows else NOT_FOUND
+    for pk in claim_ids:
+        if pk not in rows:
+            results[pk] = NOT_FOUND
+        elif rows[pk][0] == user.pk:
+            results[pk] = CLAIMED
+        elif rows[pk][0] is None and one_per is not None and rows[pk][1] in working:
+            results[pk] = ALREADY_WORKING
+        else:
+            results[pk] = TAKEN
+    return results
+
+def claim_batch(user, claim_meal_shifts=(), release_meal_shifts=(),
+        claim_bike_shifts=(), release_bike_shifts=()):
+    """
+    Claim and release many meal and bike shifts at once, in one transaction.
+    Releases happen first, so a camper can swap shifts within a meal.
+
+    Returns {'meal_shifts': {pk: result}, 'bike_shifts': {pk: result}}.
+    """
+    with atomic():
+        return {
+            'meal_shifts': _shifts_changed(_claim_batch(MealShift.objects.all(),
+                'worker', user, claim_meal_shifts, release_meal_shifts,
+                one_per='meal')),
+            'bike_shifts': _bike_shifts_changed(_claim_batch(
+                BikeMutationSchedule.objects.all(), 'worker', user,
+                claim_bike_shifts, release_bike_shifts)),
+        }
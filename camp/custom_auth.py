@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 
 from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 UserModel = get_user_model()
 
@@ -13,15 +15,28 @@ class EmailOrUsernameModelBackend(ModelBackend):
         if username:
             username = username.strip().lower()
 
-        try:
-            try:
-                user = UserModel._default_manager.filter(username__iexact=username).get()
-            except UserModel.DoesNotExist:
-                user = UserModel._default_manager.filter(email__iexact=username).get()
-        except UserModel.DoesNotExist:
+        # one query for both, matching the lower() indexes of migration 0026.
+        users = UserModel._default_manager.annotate(
+            username_key=Lower(UserModel.USERNAME_FIELD),
+            email_key=Lower('email'),
+        ).filter(Q(username_key=username) | Q(email_key=username)).order_by()
+
+        user = None
+        by_email = []
+        for candidate in users:
+            if candidate.username_key == username:
+                # someone's username wins over someone else's email.
+                user = candidate
+                break
+            by_email.append(candidate)
+        else:
+            # an email shared by several accounts names none of them.
+            if len(by_email) == 1:
+                user = by_email[0]
+
+        if user is None:
             # Run the default password hasher once to reduce the timing
             # difference between an existing and a non-existing user (#20760).
             UserModel().set_password(password)
-        else:
-            if user.check_password(password) and self.user_can_authenticate(user):
-                return user
+        elif user.check_password(password) and self.user_can_authenticate(user):
+            return user
@@ -43,3 +43,67 @@ class MealShiftFactory(DjangoModelFactory):
 
     class Meta:
         model = "camp.MealShift"
+
+class BikeMutationScheduleFactory(DjangoModelFactory):
+    event = factory.SubFactory(EventFactory)
+    date = factory.LazyAttribute(lambda o: o.event.start_date)
+    shift = "Morning"
+
+    class Meta:
+        model = "camp.BikeMutationSchedule"
+
+class MealRestrictionFactory(DjangoModelFactory):
+    name = factory.Sequence(lambda n: "restriction %d" % n)
+
+    class Meta:
+        model = "camp.MealRestriction"
+
+class UserAttendanceFactory(DjangoModelFactory):
+    user = factory.SubFactory(UserFactory)
+    event = factory.SubFactory(EventFactory)
+    camping_this_year = True
+    arrival_date = factory.LazyAttribute(lambda o: timezone.make_aware(
+        datetime.combine(o.event.start_date, datetime.min.time()) + timedelta(hours=12)))
+    departure_date = factory.LazyAttribute(lambda o: o.arrival_date + timedelta(days=5))
+
+    class Meta:
+        model = "camp.UserAttendance"
+
+class VehicleFactory(DjangoModelFactory):
+    user = factory.SubFactory(UserFactory)
+    event = factory.SubFactory(EventFactory)
+    transit_arrangement = 1 # driving
+
+    class Meta:
+        model = "camp.Vehicle"
+
+class ShelterFactory(DjangoModelFactory):
+    user = factory.SubFactory(UserFactory)
+    event = factory.SubFactory(EventFactory)
+    sleeping_arrangement = "bringing"
+
+    class Meta:
+        model = "camp.Shelter"
+
+class BikeFactory(DjangoModelFactory):
+    bike_name = factory.Sequence(lambda n: "bike %d" % n)
+    bike_frame_size_inches = 18
+    bike_owner = factory.SubFactory(UserFactory)
+
+    class Meta:
+        model = "camp.Bike"
+
+class InventoryFactory(DjangoModelFactory):
+    item = factory.Sequence(lambda n: "item %d" % n)
+    quantity = 1
+
+    class Meta:
+        model = "camp.Inventory"
+
+class BicycleMutationInventoryFactory(DjangoModelFactory):
+    material = factory.Sequence(lambda n: "material %d" % n)
+    quantity = 1
+    units = "each"
+
+    class Meta:
+        model = "camp.BicycleMutationInventory"
@@ -8,10 +8,13 @@ from django.contrib.auth.forms import PasswordResetForm as DjPasswordResetForm
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.mail import EmailMultiAlternatives
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.template import loader
+from django.utils.html import format_html
 
 from arrow.parser import ParserError
 
+from .shortcuts import get_current_event
 from .models import (
     Bike, BicycleMutationInventory, BikeMutationSchedule, Inventory,
     Meal, MealShift, Shelter, User, UserAttendance, Vehicle)
@@ -216,12 +219,69 @@ class UserAttendanceForm(forms.ModelForm):
       }
 
 
+def transit_providers(event):
+  drivers = Vehicle.objects.filter(event=event, transit_arrangement=DRIVING)
+  return User.objects.filter(pk__in=drivers.values('user'))
+
+def shelter_providers(event):
+  shelters = Shelter.objects.filter(event=event # declared a shelter
+    ).exclude(sleeping_arrangement=sharing_someone_elses) # not sharing
+  return User.objects.filter(pk__in=shelters.values('user'))
+
+PROVIDERS = {'transit': transit_providers, 'shelter': shelter_providers}
+
+def provider_label(first_name, last_name, playa_name):
+  label = "%s %s" % (first_name, last_name)
+  return "%s (%s)" % (label, playa_name) if playa_name else label
+
+def search_providers(kind, event, term, limit):
+  """
+  Up to limit of an event's providers of a kind, as {'id', 'label'}, where
+  each word of term starts someone's first, last or playa name.
+  """
+  providers = PROVIDERS[kind](event)
+  for word in term.split():
+    providers = providers.filter(Q(first_name__istartswith=word) |
+      Q(last_name__istartswith=word) | Q(playa_name__istartswith=word))
+  rows = providers.order_by('first_name', 'last_name', 'pk').values_list(
+    'pk', 'first_name', 'last_name', 'playa_name')[:limit]
+  return [{'id': pk, 'label': provider_label(first_name, last_name, playa_name)}
+    for pk, first_name, last_name, playa_name in rows]
+
+class ProviderSearchInput(forms.Widget):
+  """
+  A box that searches a kind of provider as you type, filling a hidden
+  input with the chosen one's pk. Unlike a select it renders no choices,
+  so the page is the same size however big the camp is, and the field
+  only has to check the one pk that is posted.
+  """
+  def __init__(self, kind, attrs=None):
+    super(ProviderSearchInput, self).__init__(attrs)
+    self.kind = kind
+
+  def render(self, name, value, attrs=None, renderer=None):
+    attrs = self.build_attrs(self.attrs, attrs)
+    label = ''
+    try:
+      names = User.objects.filter(pk=value).values_list(
+        'first_name', 'last_name', 'playa_name').first() if value else None
+    except ValueError:
+      # whatever was posted wasn't a pk.
+      names = None
+    if names:
+      label = provider_label(*names)
+    return format_html('<input type="hidden" name="{}" value="{}">'
+      '<input type="text" id="{}" class="provider-search" data-url="{}" '
+      'value="{}" placeholder="Start typing their name" autocomplete="off">',
+      name, value if names else '', attrs.get('id', ''),
+      reverse('provider_search', kwargs={'kind': self.kind}), label)
+
 class VehicleForm(forms.ModelForm):
   def __init__(self, user=None, **kwargs):
     self.user = user
     super(VehicleForm, self).__init__(**kwargs)
-    providers = User.objects.filter(vehicle__transit_arrangement=DRIVING
-      ).exclude(vehicle__user=user) # can't share with self
+    providers = transit_providers(get_current_event()
+      ).exclude(pk=getattr(user, 'pk', None)) # can't share with self
     self.fields['transit_provider'].queryset = providers
 
   class Meta:
@@ -231,6 +291,7 @@ class VehicleForm(forms.ModelForm):
       'model_of_car', 'make_of_car',
       'width', 'length'
     )
+    widgets = {'transit_provider': ProviderSearchInput('transit')}
 
   def clean(self):
     cleaned_data = super(VehicleForm, self).clean()
@@ -239,7 +300,7 @@ class VehicleForm(forms.ModelForm):
         raise ValidationError("Please supply your car's make and model if you are the primary driver in your party.")
 
     if cleaned_data['transit_arrangement'] == RIDING_WITH:
-      if (not cleaned_data['transit_provider']):
+      if not cleaned_data.get('transit_provider'):
         raise ValidationError("If you're riding with someone, you must tell us who.")
 
     return cleaned_data
@@ -249,9 +310,8 @@ class ShelterForm(forms.ModelForm):
     self.user = user
     super(ShelterForm, self).__init__(**kwargs)
 
-    providers = User.objects.exclude(shelter=None # declared a shelter
-      ).exclude(shelter__sleeping_arrangement=sharing_someone_elses # not sharing
-      ).exclude(shelter__user=user) # not yourself
+    providers = shelter_providers(get_current_event()
+      ).exclude(pk=getattr(user, 'pk', None)) # not yourself
 
     self.fields['shelter_provider'].queryset = providers
 
@@ -286,6 +346,7 @@ class ShelterForm(forms.ModelForm):
         'number_of_people_tent_sleeps', 'sleeping_under_ubertent',
         'width', 'length'
     )
+    widgets = {'shelter_provider': ProviderSearchInput('shelter')}
 
 class BikeForm(forms.ModelForm):
     class Meta:
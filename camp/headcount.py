@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+
+from collections import defaultdict
+
+from django.db import IntegrityError
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.transaction import atomic
+
+from .models import DailyHeadcount, UserAttendance
+from .schedule import attendance_counts, _local_date, _transition_bucket
+
+COUNT_FIELDS = (
+    'arriving', 'arriving_breakfast', 'arriving_dinner', 'arriving_late',
+    'departing', 'departing_breakfast', 'departing_dinner', 'departing_late',
+    'staying', 'unconfirmed',
+)
+
+# The fields of an attendance that the headcount depends on.
+STATE_FIELDS = ('event_id', 'user_id', 'arrival_date', 'departure_date',
+    'camping_this_year')
+
+# the state of an attendance loaded without some of STATE_FIELDS.
+UNKNOWN = 'unknown'
+
+
+def _state(pk, values):
+    if pk is None or not values['camping_this_year']:
+        return None
+    return (values['event_id'], values['user_id'],
+        values['arrival_date'], values['departure_date'])
+
+def attendance_state(attendance):
+    """
+    The parts of an attendance that the headcount depends on, or None if it
+    doesn't count toward any headcount.
+    """
+    return _state(attendance.pk,
+        {field: getattr(attendance, field) for field in STATE_FIELDS})
+
+def loaded_attendance_state(attendance):
+    """
+    attendance_state() from what was loaded, or UNKNOWN if some of it was
+    deferred; reading the attributes would fetch each one.
+    """
+    values = attendance.__dict__
+    if any(field not in values for field in STATE_FIELDS):
+        return UNKNOWN
+    return _state(values.get('id'), values)
+
+def stored_attendance_state(pk):
+    """
+    attendance_state() of an attendance as it is in the database.
+    """
+    row = UserAttendance.objects.filter(pk=pk).values_list('event', 'user',
+        'arrival_date', 'departure_date', 'camping_this_year').first()
+    return _state(pk, dict(zip(STATE_FIELDS, row))) if row else None
+
+def rebuild_headcounts(event):
+    """
+    Recount every day of an event from its attendance.
+    """
+    days = list(event.days)
+    windows = list(UserAttendance.objects.attendees(event).values_list(
+        'arrival_date', 'departure_date'))
+
+    headcounts = [
+        DailyHeadcount(event=event, day=day, **counts)
+        for day, counts in zip(days, attendance_counts(days, windows))
+    ]
+
+    with atomic():
+        DailyHeadcount.objects.filter(event=event).delete()
+        DailyHeadcount.objects.bulk_create(headcounts)
+
+def headcounts(event):
+    """
+    Per-day counts for an event, in the shape the calendar renders.
+
+    The table is rebuilt if any of the event's days are missing from it.
+    """
+    days = list(event.days)
+    rows = list(DailyHeadcount.objects.filter(event=event, day__in=days))
+    if len(rows) != len(days):
+        try:
+            rebuild_headcounts(event)
+        except IntegrityError:
+            # someone else rebuilt it at the same time.
+            pass
+        rows = list(DailyHeadcount.objects.filter(event=event, day__in=days))
+
+    return [{field: getattr(row, field) for field in COUNT_FIELDS}
+        for row in rows]
+
+def _window_changes(sign, arrival, departure):
+    """
+    What one attendance adds to each count, as {field: [(days, amount)]},
+    the days being a Q on the headcount rows or None for all of them. The
+    same counting as attendance_counts(), without needing the event's days.
+    """
+    changes = defaultdict(list)
+    for prefix, when in (('arriving', arrival), ('departing', departure)):
+        if when is not None:
+            on = Q(day=_local_date(when))
+            changes[prefix].append((on, sign))
+            changes[prefix + '_' + _transition_bucket(when)].append((on, sign))
+
+    if arrival is None or departure is None:
+        changes['unconfirmed'].append((None, sign))
+    else:
+        changes['staying'].append((Q(day__gt=_local_date(arrival),
+            day__lt=_local_date(departure)), sign))
+    return changes
+
+def _apply_changes(event_id, changes):
+    updates = {}
+    for field, terms in changes.items():
+        value = F(field)
+        for days, amount in terms:
+            if days is None:
+                value += Value(amount)
+            else:
+                value += Case(When(days, then=Value(amount)),
+                    default=Value(0), output_field=IntegerField())
+        updates[field] = value
+    # no rows if the table isn't built; the next read builds it.
+    DailyHeadcount.objects.filter(event_id=event_id).update(**updates)
+
+def update_for_attendance(old_state, new_state):
+    """
+    Move one attendance's contribution from old_state to new_state, in one
+    UPDATE for each event involved.
+    """
+    if old_state == new_state:
+        return
+
+    by_event = defaultdict(lambda: defaultdict(list))
+    for sign, state in ((-1, old_state), (1, new_state)):
+        if state is not None:
+            event_id, _, arrival, departure = state
+            for field, terms in _window_changes(sign, arrival, departure).items():
+                by_event[event_id][field].extend(terms)
+
+    for event_id, changes in by_event.items():
+        _apply_changes(event_id, changes)
@@ -0,0 +1,161 @@
+from __future__ import absolute_import
+
+import heapq
+import json
+import logging
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import Template
+
+logger = logging.getLogger('camp.instrumentation')
+
+# how many of a request's slowest statements to log, and how much of each.
+SLOWEST_STATEMENTS = 3
+STATEMENT_LENGTH = 200
+
+_current = threading.local()
+
+
+class RequestStats(object):
+    """
+    What one request spent on SQL and templates.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self._slowest = []
+        self._template_depth = 0
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        entry = (duration, sql[:STATEMENT_LENGTH])
+        if len(self._slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return sorted(self._slowest, reverse=True)
+
+    @property
+    def total_time(self):
+        return time.time() - self.started
+
+
+class TimedCursorWrapper(CursorWrapper):
+    """
+    Times each statement into a RequestStats. Unlike connection.queries, it
+    works with DEBUG off.
+    """
+    def __init__(self, cursor, db, stats):
+        super(TimedCursorWrapper, self).__init__(cursor, db)
+        self.stats = stats
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            self.stats.record_query(sql, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.stats.record_query(sql, time.time() - start)
+
+
+def _timed(make_cursor, db, stats):
+    return lambda cursor: TimedCursorWrapper(make_cursor(cursor), db, stats)
+
+def _start(stats):
+    _current.stats = stats
+    for db in connections.all():
+        db.make_cursor = _timed(db.make_cursor, db, stats)
+        db.make_debug_cursor = _timed(db.make_debug_cursor, db, stats)
+
+def _stop():
+    _current.stats = None
+    for db in connections.all():
+        # back to the class's methods.
+        db.__dict__.pop('make_cursor', None)
+        db.__dict__.pop('make_debug_cursor', None)
+
+
+_template_render = Template.render
+
+def _timed_template_render(self, context=None, request=None):
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return _template_render(self, context, request)
+
+    # a template rendered while rendering another is already being timed.
+    stats._template_depth += 1
+    start = time.time()
+    try:
+        return _template_render(self, context, request)
+    finally:
+        stats._template_depth -= 1
+        if not stats._template_depth:
+            stats.template_time += time.time() - start
+
+Template.render = _timed_template_render
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+def server_timing(stats):
+    return ', '.join([
+        'sql;dur=%s;desc="%s queries"' % (_ms(stats.sql_time), stats.queries),
+        'template;dur=%s' % _ms(stats.template_time),
+        'total;dur=%s' % _ms(stats.total_time),
+    ])
+
+
+class InstrumentationMiddleware(object):
+    """
+    Counts and times each request's queries and template rendering, and
+    logs them per view. Staff also get them in a Server-Timing header, which
+    browser dev tools show alongside the request.
+
+    List it first in MIDDLEWARE so it sees everything the other middleware
+    does. The cursors are unwrapped however the request ends, so a failure
+    further in can't leave the next request counting its queries twice.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = request._stats = RequestStats()
+        _start(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _stop()
+
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': stats.queries,
+            'sql_ms': _ms(stats.sql_time),
+            'template_ms': _ms(stats.template_time),
+            'total_ms': _ms(stats.total_time),
+            'slowest': [{'ms': _ms(duration), 'sql': sql}
+                for duration, sql in stats.slowest],
+        }, sort_keys=True))
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            response['Server-Timing'] = server_timing(stats)
+        return response
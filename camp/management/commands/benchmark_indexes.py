@@ -0,0 +1,43 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from camp import benchmark
+from camp.models import Event
+
+
+class Command(BaseCommand):
+    help = ("Compares the hot queries' plans and timings with and without "
+        "their composite indexes, on a synthetic camp in a throwaway test "
+        "database. Run it once per database backend.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campers', type=int, default=5000,
+            help="How many campers the synthetic camp has.")
+        parser.add_argument('--repeat', type=int, default=20,
+            help="Times each query is run.")
+
+    def handle(self, **options):
+        o = options
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('generate_camp', campers=o['campers'],
+                name='Index benchmark', stdout=StringIO())
+            event = Event.objects.get(name='Index benchmark')
+            indexed = benchmark.plans(event, o['repeat'])
+            benchmark.drop_indexes()
+            unindexed = benchmark.plans(event, o['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write("%s, %d campers" % (connection.vendor, o['campers']))
+        for name, stats in indexed.items():
+            before = unindexed[name]
+            self.stdout.write("\n%s: %s ms without the indexes, %s ms with them"
+                % (name, before['p50_ms'], stats['p50_ms']))
+            for label, plan in (('without', before['plan']), ('with', stats['plan'])):
+                for i, step in enumerate(plan):
+                    self.stdout.write("  %-8s %s" % ('' if i else label + ':', step))
@@ -0,0 +1,81 @@
+import logging
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from camp import benchmark
+
+BASELINE = os.path.join(os.path.dirname(benchmark.__file__),
+    'benchmark_baseline.json')
+
+
+def _parse_sizes(value):
+    return [int(size) for size in value.split(',')]
+
+class Command(BaseCommand):
+    help = ("Benchmarks the heaviest views against synthetic camps in a "
+        "throwaway test database, and compares them to a baseline")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=_parse_sizes,
+            default=[100, 1000, 3000],
+            help="Comma separated numbers of campers to benchmark with.")
+        parser.add_argument('--repeat', type=int, default=20,
+            help="Requests timed per view and size. Latency is only compared "
+                "to the baseline with at least %d." % benchmark.MIN_TIMED_REPEAT)
+        parser.add_argument('--baseline', default=BASELINE,
+            help="JSON results to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.25,
+            help="How much slower or bigger than the baseline, as a fraction "
+                "of it, counts as a regression. Query counts may not grow at all.")
+        parser.add_argument('--save', action='store_true',
+            help="Write these results as the new baseline instead of "
+                "comparing. Timings are only comparable on the same machine.")
+
+    def handle(self, **options):
+        o = options
+        # a log line per request would bury the results.
+        logging.getLogger('camp.instrumentation').setLevel(logging.WARNING)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # no debug overhead or https redirects, and the test client's host.
+            with override_settings(DEBUG=False, SECURE_SSL_REDIRECT=False,
+                    ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+                    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+                results = benchmark.run(o['sizes'], o['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write("%8s %-14s %-6s %9s %9s %8s" % (
+            'campers', 'view', 'cache', 'p50 ms', 'p95 ms', 'queries'))
+        for size in o['sizes']:
+            for name, url_name, data in benchmark.VIEWS:
+                for mode in benchmark.CACHE_MODES:
+                    stats = results[str(size)][name][mode]
+                    self.stdout.write("%8s %-14s %-6s %9s %9s %8s" % (size,
+                        name, mode, stats['p50_ms'], stats['p95_ms'],
+                        stats['queries']))
+
+        if o['save']:
+            benchmark.save(results, o['baseline'])
+            self.stdout.write("Saved the baseline to %s" % o['baseline'])
+            return
+        if not os.path.exists(o['baseline']):
+            raise CommandError("No baseline at %s; make one with --save."
+                % o['baseline'])
+
+        if o['repeat'] < benchmark.MIN_TIMED_REPEAT:
+            self.stdout.write("Too few requests to compare latency; only "
+                "queries are checked.")
+        regressions = benchmark.compare(results, benchmark.load(o['baseline']),
+            o['threshold'], o['repeat'])
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError("%d regressions against %s" % (len(regressions),
+                o['baseline']))
+        self.stdout.write("No regressions against %s" % o['baseline'])
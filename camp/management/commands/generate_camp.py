@@ -0,0 +1,260 @@
+import random
+import time
+from datetime import datetime, time as midnight, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from camp.headcount import rebuild_headcounts
+from camp.models import (BicycleMutationInventory, Bike, BikeMutationSchedule,
+    Bike_repairs, Event, Inventory, Meal, MealRestriction, MealShift,
+    PYB_shifts, Shelter, User, UserAttendance, Vehicle, SIZE_CHOICES,
+    bringing_own_tent, sharing_someone_elses, sleep_in_vehicle, undetermined,
+    DRIVING, RIDING_WITH, UNDETERMINED)
+
+FIRST_NAMES = ['Ash', 'Bea', 'Cal', 'Dee', 'Eli', 'Fen', 'Gus', 'Hal', 'Ivy',
+    'Jo', 'Kit', 'Lou', 'Max', 'Nia', 'Oz', 'Pip', 'Quin', 'Rae', 'Sol', 'Tam']
+LAST_NAMES = ['Ames', 'Boyd', 'Cruz', 'Diaz', 'Egan', 'Frey', 'Gray', 'Hahn',
+    'Ito', 'Jain', 'Kerr', 'Lund', 'Moss', 'Noor', 'Ortiz', 'Park', 'Quan',
+    'Reyes', 'Shaw', 'Tran']
+PLAYA_NAMES = ['Sparkle', 'Dusty', 'Glowstick', 'Moth', 'Captain', 'Biscuit',
+    'Zephyr', 'Pickles', 'Nova', 'Wombat']
+RESTRICTIONS = ['Vegetarian', 'Vegan', 'Gluten free', 'Nut allergy',
+    'Dairy free', 'Pescatarian']
+CARS = [('Ford', 'F-150'), ('Toyota', 'Tacoma'), ('Honda', 'Odyssey'),
+    ('Subaru', 'Outback'), ('Ram', 'ProMaster')]
+
+# founders have no sponsor; each later wave is sponsored from the ones
+# before it.
+SPONSOR_WAVES = (0.05, 0.3, 1.0)
+
+
+def _parse_date(value):
+    year, month, day = map(int, value.split('-'))
+
+    return datetime(year, month, day)
+
+class Command(BaseCommand):
+    help = "Generates a synthetic camp for load tests and benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campers', type=int, default=300,
+            help="How many campers to create.")
+        parser.add_argument('--seed', type=int, default=0,
+            help="The same seed and scale always make the same camp.")
+        parser.add_argument('--start', type=_parse_date, default='2030-08-21',
+            help="First day of the event, in YYYY-MM-DD format. The default "
+                "is late enough to make it the current event.")
+        parser.add_argument('--days', type=int, default=12,
+            help="How long the event runs.")
+        parser.add_argument('--name', default=None,
+            help="Event name; 'Synthetic camp <seed>' by default.")
+
+    def handle(self, **options):
+        o = options
+        rng = random.Random(o['seed'])
+        name = o['name'] or 'Synthetic camp %s' % o['seed']
+        if Event.objects.filter(name=name).exists():
+            raise CommandError("Event %s already exists." % name)
+        # usernames must be unique across runs with different seeds.
+        self.prefix = 'synthetic-%s-' % o['seed']
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError("Campers for seed %s already exist." % o['seed'])
+
+        started = time.time()
+        with atomic():
+            start = o['start'].date()
+            event = Event.objects.create(name=name, start_date=start,
+                end_date=start + timedelta(days=o['days']))
+            campers = self.create_campers(rng, o['campers'])
+            attendees = self.create_attendance(rng, event, campers)
+            self.create_restrictions(rng, campers)
+            self.create_vehicles(rng, event, attendees)
+            self.create_shelters(rng, event, attendees)
+            self.create_gear(rng, campers)
+            meals, shifts = self.create_meals(rng, event, attendees)
+            bike_shifts = self.create_bike_shifts(rng, event, attendees)
+            # bulk inserts skip the signals that keep these up to date.
+            rebuild_headcounts(event)
+
+        self.stdout.write("Created %s with %d campers (%d attending), %d meals, "
+            "%d meal shifts and %d bike shifts in %.1fs" % (event, len(campers),
+                len(attendees), meals, shifts, bike_shifts,
+                time.time() - started))
+
+    def create_campers(self, rng, count):
+        """
+        Insert campers in sponsor waves, returning their pks in order.
+        """
+        # hashing is slow, and every synthetic camper shares a password.
+        password = make_password('synthetic')
+        now = timezone.now()
+        pks = []
+        for wave in SPONSOR_WAVES:
+            users = []
+            for i in range(len(pks), max(1, int(count * wave))):
+                first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+                username = '%s%05d' % (self.prefix, i)
+                users.append(User(username=username, password=password,
+                    email='%s@example.com' % username, date_joined=now,
+                    first_name=first, last_name=last,
+                    playa_name=rng.choice(PLAYA_NAMES) if rng.random() < 0.3 else '',
+                    sponsor_id=rng.choice(pks) if pks else None))
+            User.objects.bulk_create(users)
+            # only postgres hands back pks from a bulk insert.
+            pks_by_name = dict(User.objects.filter(
+                username__in=[u.username for u in users]
+                ).values_list('username', 'pk'))
+            pks.extend(pks_by_name[u.username] for u in users)
+        return pks
+
+    def create_attendance(self, rng, event, campers):
+        """
+        Give most campers an attendance window, returning who is coming.
+        """
+        tz = timezone.get_default_timezone()
+        days = (event.end_date - event.start_date).days
+        first = datetime.combine(event.start_date, midnight())
+        last = datetime.combine(event.end_date, midnight())
+        attendances = []
+        attendees = []
+        for pk in campers:
+            camping = rng.random() < 0.9
+            arrival = first + timedelta(days=rng.randint(0, days // 3),
+                hours=rng.randint(6, 23))
+            departure = last - timedelta(days=rng.randint(0, days // 3),
+                hours=rng.randint(0, 16))
+            attendances.append(UserAttendance(user_id=pk, event=event,
+                arrival_date=timezone.make_aware(arrival, tz),
+                departure_date=timezone.make_aware(departure, tz),
+                camping_this_year=camping, has_ticket=rng.random() < 0.8,
+                looking_for_ticket=rng.random() < 0.2,
+                paid_dues=rng.random() < 0.7))
+            if camping:
+                attendees.append(pk)
+        UserAttendance.objects.bulk_create(attendances)
+        return attendees
+
+    def create_restrictions(self, rng, campers):
+        restrictions = [MealRestriction.objects.get_or_create(name=name)[0].pk
+            for name in RESTRICTIONS]
+        Through = User.meal_restrictions.through
+        rows = []
+        for pk in campers:
+            if rng.random() < 0.4:
+                for restriction in rng.sample(restrictions, rng.randint(1, 2)):
+                    rows.append(Through(user_id=pk, mealrestriction_id=restriction))
+        Through.objects.bulk_create(rows)
+
+    def create_vehicles(self, rng, event, attendees):
+        drivers = [pk for pk in attendees if rng.random() < 0.35] or attendees[:1]
+        is_driver = set(drivers)
+        vehicles = []
+        for pk in attendees:
+            if pk in is_driver:
+                make, model = rng.choice(CARS)
+                vehicles.append(Vehicle(user_id=pk, event=event,
+                    transit_arrangement=DRIVING, make_of_car=make,
+                    model_of_car=model,
+                    width=rng.choice(SIZE_CHOICES)[0],
+                    length=rng.choice(SIZE_CHOICES)[0]))
+            elif rng.random() < 0.75:
+                vehicles.append(Vehicle(user_id=pk, event=event,
+                    transit_arrangement=RIDING_WITH,
+                    transit_provider_id=rng.choice(drivers)))
+            else:
+                vehicles.append(Vehicle(user_id=pk, event=event,
+                    transit_arrangement=UNDETERMINED))
+        Vehicle.objects.bulk_create(vehicles)
+
+    def create_shelters(self, rng, event, attendees):
+        """
+        Tents, and campers sharing them; someone may share with a camper who
+        is sharing with someone else, making chains.
+        """
+        shelters = []
+        housed = []
+        for pk in attendees:
+            roll = rng.random()
+            if not housed or roll < 0.4:
+                shelters.append(Shelter(user_id=pk, event=event,
+                    sleeping_arrangement=bringing_own_tent,
+                    number_of_people_tent_sleeps=rng.randint(1, 6),
+                    width=rng.choice(SIZE_CHOICES)[0],
+                    length=rng.choice(SIZE_CHOICES)[0]))
+            elif roll < 0.85:
+                shelters.append(Shelter(user_id=pk, event=event,
+                    sleeping_arrangement=sharing_someone_elses,
+                    shelter_provider_id=rng.choice(housed)))
+            elif roll < 0.95:
+                shelters.append(Shelter(user_id=pk, event=event,
+                    sleeping_arrangement=sleep_in_vehicle))
+            else:
+                shelters.append(Shelter(user_id=pk, event=event,
+                    sleeping_arrangement=undetermined))
+            housed.append(pk)
+        Shelter.objects.bulk_create(shelters)
+
+    def create_gear(self, rng, campers):
+        repairs = [repair for repair, _ in Bike_repairs]
+        Bike.objects.bulk_create([
+            Bike(bike_name='%s bike' % rng.choice(PLAYA_NAMES),
+                bike_frame_size_inches=rng.randint(14, 24), bike_owner_id=pk,
+                needs_repairs=rng.random() < 0.3,
+                repair_needed=rng.choice(repairs),
+                in_bike_pool_this_year=rng.random() < 0.2)
+            for pk in campers if rng.random() < 0.3])
+        Inventory.objects.bulk_create([
+            Inventory(item='item %d' % i, quantity=rng.randint(1, 20),
+                needs_repairs=rng.random() < 0.1)
+            for i in range(max(1, len(campers) // 20))])
+        BicycleMutationInventory.objects.bulk_create([
+            BicycleMutationInventory(material='material %d' % i,
+                quantity=rng.randint(0, 100), units=rng.choice(['each', 'ft', 'lb']))
+            for i in range(max(1, len(campers) // 50))])
+
+    def create_meals(self, rng, event, attendees):
+        """
+        Breakfast and dinner on every day but the first and last, the other
+        kinds in the middle of the event, each mostly staffed.
+        """
+        days = list(event.days)[1:-1]
+        middle = days[len(days) // 4:len(days) * 3 // 4]
+        meals = []
+        for day in days:
+            for kind, _ in Meal.Kinds:
+                if kind in (Meal.Midnight, Meal.Bartend) and day not in middle:
+                    continue
+                meals.append(Meal(event=event, day=day, kind=kind,
+                    chef_id=rng.choice(attendees) if rng.random() < 0.85 else None))
+        Meal.objects.bulk_create(meals)
+        pks = {(day, kind): pk for pk, day, kind in
+            Meal.objects.filter(event=event).values_list('pk', 'day', 'kind')}
+
+        shifts = []
+        for meal in meals:
+            roles = [MealShift.Sous_Chef] * 2 + [MealShift.KP] * 2
+            if meal.kind == Meal.Dinner:
+                roles.append(MealShift.Courier)
+            # one shift per camper per meal.
+            workers = rng.sample(attendees, min(len(roles), len(attendees)))
+            meal_id = pks[meal.day, meal.kind]
+            shifts.append(MealShift(meal_id=meal_id, role=MealShift.Chef))
+            for role, worker in zip(roles, workers):
+                shifts.append(MealShift(meal_id=meal_id, role=role,
+                    worker_id=worker if rng.random() < 0.7 else None))
+        MealShift.objects.bulk_create(shifts)
+        return len(meals), len(shifts)
+
+    def create_bike_shifts(self, rng, event, attendees):
+        shifts = []
+        for day in list(event.days)[1:-1]:
+            for kind, _ in PYB_shifts:
+                for i in range(4):
+                    shifts.append(BikeMutationSchedule(event=event, date=day,
+                        shift=kind,
+                        worker_id=rng.choice(attendees) if rng.random() < 0.5 else None))
+        BikeMutationSchedule.objects.bulk_create(shifts)
+        return len(shifts)
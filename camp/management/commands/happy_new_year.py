@@ -1,6 +1,8 @@
 
 from django.core.management.base import BaseCommand
+from django.db import connection
 from django.db.transaction import atomic
+from django.utils import timezone
 from django.utils.encoding import smart_str
 from datetime import datetime, timedelta
 from camp.models import (Event, Meal, User, MealShift, BikeMutationSchedule, PYB_shifts,
@@ -17,6 +19,34 @@ def _parse_date(value):
 
     return datetime(year, month, day)
 
+def _carry_over(model, from_event, to_event, **overrides):
+    """
+    Copy every row of model from one event to another in a single
+    INSERT ... SELECT, replacing the given columns' values.
+    """
+    qn = connection.ops.quote_name
+    overrides['event'] = to_event.pk
+    overrides['date'] = timezone.now()
+
+    columns, selects, params = [], [], []
+    for f in model._meta.concrete_fields:
+        if f.primary_key:
+            continue
+        columns.append(qn(f.column))
+        if f.name in overrides:
+            selects.append('%s')
+            params.append(f.get_db_prep_save(overrides[f.name], connection))
+        else:
+            selects.append(qn(f.column))
+    params.append(from_event.pk)
+
+    table = qn(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s WHERE %s = %%s' % (
+            table, ', '.join(columns), ', '.join(selects), table,
+            qn(model._meta.get_field('event').column)), params)
+        return cursor.rowcount
+
 class Command(BaseCommand):
     help = "Sets up a new event/year"
 
@@ -40,6 +70,50 @@ class Command(BaseCommand):
             action='store_false', dest='interactive', default=True,
             help='Do NOT prompt the user for input of any kind.')
 
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+            default=False, help="Print what would be created, but don't create it.")
+
+    def plan(self, o, event):
+        """
+        Unsaved meals, their chef shifts, and bike shifts for the event.
+        """
+        meals = []
+        bike_shifts = []
+
+        num_days = (o['latest_departure'] - o['earliest_arrival']).days
+        start_date = o['earliest_arrival']
+        # no meals on the first and last days
+        for i in range(1, num_days - 1):
+            day = start_date + timedelta(days=i)
+            for kind, _ in Meal.Kinds:
+                if kind == Meal.Midnight:
+                    if day < o['earliest_bbq'] or o['latest_bbq'] < day:
+                        continue
+                elif kind == Meal.Bartend:
+                    if day < o['earliest_bar'] or o['latest_bar'] < day:
+                        continue
+
+                meals.append(Meal(event=event, day=day.date(), kind=kind))
+
+            if o['earliest_bms'] <= day <= o['latest_bms']:
+                for kind, _ in PYB_shifts:
+                    for i in range(4):
+                        bike_shifts.append(BikeMutationSchedule(
+                            event=event, date=day.date(), shift=kind))
+
+        return meals, bike_shifts
+
+    def print_plan(self, event, meals, bike_shifts):
+        self.stdout.write("%s: %s to %s" % (event.name,
+            event.start_date.date(), event.end_date.date()))
+        for day in sorted({meal.day for meal in meals}):
+            kinds = [meal.kind for meal in meals if meal.day == day]
+            shifts = len([s for s in bike_shifts if s.date == day])
+            self.stdout.write("  %s: %s; %d bike shifts" % (
+                day, ", ".join(kinds), shifts))
+        self.stdout.write("Would create 1 event, %d meals, %d chef shifts, %d bike shifts" % (
+            len(meals), len(meals), len(bike_shifts)))
+
     def handle(self, **options):
         o = options
 
@@ -47,6 +121,22 @@ class Command(BaseCommand):
 
         arrival_date = o['earliest_arrival']
         event_name = "Burning Man %s" % arrival_date.year
+
+        if o['dry_run']:
+            event = Event(name=event_name,
+                start_date=arrival_date, end_date=o['latest_departure'])
+            meals, bike_shifts = self.plan(o, event)
+            self.print_plan(event, meals, bike_shifts)
+            last_event = Event.objects.filter(start_date__lt=event.start_date
+                ).order_by('-start_date').first()
+            if last_event is not None:
+                self.stdout.write("Would carry over %d shelters and %d vehicles from %s" % (
+                    Shelter.objects.filter(event=last_event).count(),
+                    Vehicle.objects.filter(event=last_event).count(), last_event))
+            if Event.objects.filter(name=event_name).exists():
+                self.stdout.write("%s already exists and would be overwritten." % event_name)
+            return
+
         if Event.objects.filter(name=event_name).exists():
             if interactive:
                 response = raw_input("%s exists - overwrite? (y/N) " % event_name)
@@ -58,32 +148,32 @@ class Command(BaseCommand):
 
             Event.objects.filter(name=event_name).delete()
 
-        num_days = (o['latest_departure'] - o['earliest_arrival']).days
         with atomic():
-            start_date = o['earliest_arrival']
             event = Event.objects.create(name=event_name,
-                start_date=start_date, end_date=o['latest_departure'])
-
-            # no meals on the first and last days
-            for i in range(1, num_days - 1):
-                day = start_date + timedelta(days=i)
-                for kind, _ in Meal.Kinds:
-                    if kind == Meal.Midnight:
-                        if day < o['earliest_bbq'] or o['latest_bbq'] < day:
-                            continue
-                    elif kind == Meal.Bartend:
-                        if day < o['earliest_bar'] or o['latest_bar'] < day:
-                            continue
-
-                    meal = Meal.objects.create(event=event, day=day, kind=kind)
-                    # Each meal needs a chef, who will define further shift needs.
-                    MealShift.objects.create(meal=meal, role=MealShift.Chef)
-
-                if o['earliest_bms'] <= day <= o['latest_bms']:
-                    for kind, _ in PYB_shifts:
-                        for i in range(4):
-                            BikeMutationSchedule.objects.create(event=event, date=day, shift=kind)
-
-            Shelter.objects.update(sleeping_arrangement=undetermined)
-            Vehicle.objects.update(transit_arrangement=UNDETERMINED)
+                start_date=arrival_date, end_date=o['latest_departure'])
+
+            meals, bike_shifts = self.plan(o, event)
+            Meal.objects.bulk_create(meals)
+            if meals and meals[0].pk is None:
+                # only postgres hands back pks from a bulk insert.
+                pks = {(day, kind): pk for pk, day, kind in
+                    Meal.objects.filter(event=event).values_list('pk', 'day', 'kind')}
+                for meal in meals:
+                    meal.pk = pks[meal.day, meal.kind]
+
+            # Each meal needs a chef, who will define further shift needs.
+            MealShift.objects.bulk_create([
+                MealShift(meal_id=meal.pk, role=MealShift.Chef) for meal in meals])
+            BikeMutationSchedule.objects.bulk_create(bike_shifts)
+
+            last_event = Event.objects.exclude(pk=event.pk
+                ).filter(start_date__lt=event.start_date
+                ).order_by('-start_date').first()
+            if last_event is not None:
+                # campers keep their tents and cars, but need to tell us
+                # their plans, and who they share with, again.
+                _carry_over(Shelter, last_event, event,
+                    sleeping_arrangement=undetermined, shelter_provider=None)
+                _carry_over(Vehicle, last_event, event,
+                    transit_arrangement=UNDETERMINED, transit_provider=None)
 
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from camp.headcount import rebuild_headcounts
+from camp.models import Event
+
+
+class Command(BaseCommand):
+    help = "Recounts the daily headcount table from attendance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='*', type=int,
+            help="Events to rebuild; all events if none are given.")
+
+    def handle(self, **options):
+        events = Event.objects.all()
+        if options['event_ids']:
+            events = events.filter(pk__in=options['event_ids'])
+
+        for event in events:
+            rebuild_headcounts(event)
+            self.stdout.write("Rebuilt headcounts for %s" % event)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camp', '0020_council_and_flatpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHeadcount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('arriving', models.IntegerField(default=0)),
+                ('arriving_breakfast', models.IntegerField(default=0)),
+                ('arriving_dinner', models.IntegerField(default=0)),
+                ('arriving_late', models.IntegerField(default=0)),
+                ('departing', models.IntegerField(default=0)),
+                ('departing_breakfast', models.IntegerField(default=0)),
+                ('departing_dinner', models.IntegerField(default=0)),
+                ('departing_late', models.IntegerField(default=0)),
+                ('staying', models.IntegerField(default=0)),
+                ('unconfirmed', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='camp.Event')),
+            ],
+            options={
+                'ordering': ('event', 'day'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyheadcount',
+            unique_together=set([('event', 'day')]),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def assign_current_event(apps, schema_editor):
+    # Until now shelters and vehicles were only ever about the current year.
+    Event = apps.get_model('camp', 'Event')
+    models = [apps.get_model('camp', model_name)
+        for model_name in ('Shelter', 'Vehicle')]
+    if not any(model.objects.exists() for model in models):
+        return
+
+    if settings.CURRENT_EVENT_ID is None:
+        event = Event.objects.order_by('-start_date').first()
+    else:
+        event = Event.objects.filter(pk=settings.CURRENT_EVENT_ID).first()
+    if event is None:
+        # the event column can't stay empty; 0017 makes the same stand-in.
+        start, end = datetime(1999, 8, 28), datetime(1999, 9, 6)
+        event = Event.objects.create(name="Burning Man 1999",
+            start_date=start, end_date=end)
+
+    for model in models:
+        model.objects.update(event=event)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('camp', '0021_daily_headcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shelter',
+            name='event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='event',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.RunPython(assign_current_event, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='shelter',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.AlterField(
+            model_name='shelter',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='shelter',
+            unique_together=set([('user', 'event')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='vehicle',
+            unique_together=set([('user', 'event')]),
+        ),
+    ]
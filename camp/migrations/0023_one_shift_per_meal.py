@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+def release_duplicate_shifts(apps, schema_editor):
+    # keep each worker's earliest shift at a meal, and free the rest.
+    MealShift = apps.get_model('camp', 'MealShift')
+    seen = set()
+    duplicates = []
+    for pk, meal_id, worker_id in MealShift.objects.filter(
+            worker__isnull=False).order_by('pk').values_list('pk', 'meal', 'worker'):
+        if (meal_id, worker_id) in seen:
+            duplicates.append(pk)
+        seen.add((meal_id, worker_id))
+    MealShift.objects.filter(pk__in=duplicates).update(worker=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('camp', '0022_per_event_shelter_and_vehicle'),
+    ]
+
+    operations = [
+        migrations.RunPython(release_duplicate_shifts, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='mealshift',
+            unique_together=set([('meal', 'worker')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('camp', '0024_event_data_version'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='userattendance',
+            index_together=set([('event', 'camping_this_year', 'arrival_date', 'departure_date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='meal',
+            index_together=set([('event', 'day', 'kind')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='bikemutationschedule',
+            index_together=set([('event', 'date', 'shift')]),
+        ),
+        # the indexes above lead with event, which covers the foreign keys.
+        migrations.AlterField(
+            model_name='userattendance',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.AlterField(
+            model_name='meal',
+            name='event',
+            field=models.ForeignKey(db_index=False, help_text='What year/regional is this for?', on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+        migrations.AlterField(
+            model_name='bikemutationschedule',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='camp.Event'),
+        ),
+    ]
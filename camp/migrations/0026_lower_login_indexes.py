@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Expression indexes for the case-insensitive login lookup, which the
+    migration operations can't describe. Postgres and SQLite share the syntax.
+    """
+
+    dependencies = [
+        ('camp', '0025_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['CREATE INDEX camp_user_username_lower ON camp_user (LOWER(username))'],
+            ['DROP INDEX camp_user_username_lower'],
+        ),
+        migrations.RunSQL(
+            ['CREATE INDEX camp_user_email_lower ON camp_user (LOWER(email))'],
+            ['DROP INDEX camp_user_email_lower'],
+        ),
+    ]
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 from datetime import timedelta
 
 from django.contrib.auth.models import AbstractUser, BaseUserManager, AnonymousUser
+from django.core.cache import cache
 from django.db import models
 from django.forms import ModelForm
 from django.utils import timezone
@@ -191,7 +192,17 @@ class UserManager(BaseUserManager):
                                  **extra_fields)
 
 COUNCIL_GROUP = 'Council'
+# membership is cached per user; group changes clear it in this process,
+# and the timeout bounds how stale other processes can be.
+COUNCIL_CACHE_SECONDS = 300
 AnonymousUser.is_council = False
+
+def council_cache_key(user_id):
+    return 'camp:is_council:%s' % user_id
+
+def forget_council_membership(user_ids):
+    cache.delete_many([council_cache_key(pk) for pk in user_ids])
+
 class User(AbstractUser):
     # FIXME: if we don't want these nullable, we should have them as part of
     # signup.
@@ -211,7 +222,14 @@ class User(AbstractUser):
 
     @property
     def is_council(self):
-        return COUNCIL_GROUP in {g.name for g in self.groups.all()}
+        if getattr(self, '_is_council', None) is None:
+            key = council_cache_key(self.pk)
+            is_council = cache.get(key)
+            if is_council is None:
+                is_council = self.groups.filter(name=COUNCIL_GROUP).exists()
+                cache.set(key, is_council, COUNCIL_CACHE_SECONDS)
+            self._is_council = is_council
+        return self._is_council
 
     @property
     def display_name(self):
@@ -220,8 +238,37 @@ class User(AbstractUser):
 
     @property
     def attendance(self):
-        return UserAttendance.objects.get_or_create(
-            user=self, event=get_current_event())[0]
+        """
+        This user's attendance at the current event. If they haven't said
+        anything about it yet, an unsaved one is returned instead.
+        """
+        if getattr(self, '_attendance', None) is None:
+            attach_attendance([self])
+        return self._attendance
+
+    @property
+    def vehicle(self):
+        """
+        This user's vehicle for the current event; raises
+        Vehicle.DoesNotExist if they haven't told us about one.
+        """
+        if not hasattr(self, '_vehicle'):
+            attach_vehicles([self])
+        if self._vehicle is None:
+            raise Vehicle.DoesNotExist()
+        return self._vehicle
+
+    @property
+    def shelter(self):
+        """
+        This user's shelter for the current event; raises
+        Shelter.DoesNotExist if they haven't told us about one.
+        """
+        if not hasattr(self, '_shelter'):
+            attach_shelters([self])
+        if self._shelter is None:
+            raise Shelter.DoesNotExist()
+        return self._shelter
 
     def __unicode__(self):
         return '%s' % self.display_name
@@ -230,15 +277,18 @@ class User(AbstractUser):
         ordering = ('last_name', 'first_name')
 
 class UserAttendanceQS(models.QuerySet):
-    def attendees(self):
-        return self.filter(event=get_current_event(), camping_this_year=True)
+    def attendees(self, event=None):
+        if event is None:
+            event = get_current_event()
+        return self.filter(event=event, camping_this_year=True)
 
 BREAKFAST_TIME = 10
 DINNER_TIME = 19
 
 class UserAttendance(models.Model):
     user = models.ForeignKey(User)
-    event = models.ForeignKey(Event)
+    # the composite index below leads with event.
+    event = models.ForeignKey(Event, db_index=False)
 
     arrival_date =  models.DateTimeField(null=True, blank=True)
     departure_date = models.DateTimeField(null=True, blank=True)
@@ -252,11 +302,95 @@ class UserAttendance(models.Model):
 
     class Meta:
         unique_together = (('user', 'event'),)
+        # attendees() and the attendance windows read from it.
+        index_together = (('event', 'camping_this_year', 'arrival_date',
+            'departure_date'),)
 
     def __unicode__(self):
-        event = get_current_event()
         return u'%s attending %s' % (self.user, self.event)
 
+def _attach_for_event(users, event, model, attr, missing=None, related=()):
+    """
+    Load one model row per user for an event in one query, storing it (or
+    missing(user) if there is none) as user.<attr>.
+    """
+    if event is None:
+        event = get_current_event()
+
+    rows = model.objects.filter(event=event).select_related(*related)
+    if isinstance(users, models.QuerySet):
+        rows = rows.filter(user__in=users.values('pk'))
+        users = list(users)
+    else:
+        users = list(users)
+        rows = rows.filter(user__in=[u.pk for u in users])
+
+    by_user = {row.user_id: row for row in rows}
+    for user in users:
+        row = by_user.get(user.pk)
+        if row is None and missing is not None:
+            row = missing(event)
+        if row is not None:
+            row.user = user
+        setattr(user, attr, row)
+    return users
+
+def attach_attendance(users, event=None):
+    """
+    Load attendance at an event (the current one by default) for many users
+    in one query, setting what each user's .attendance returns. Users who
+    have none get an unsaved UserAttendance; nothing is written here.
+    """
+    return _attach_for_event(users, event, UserAttendance, '_attendance',
+        missing=lambda event: UserAttendance(event=event))
+
+def attach_vehicles(users, event=None):
+    return _attach_for_event(users, event, Vehicle, '_vehicle',
+        related=['transit_provider'])
+
+def attach_shelters(users, event=None):
+    return _attach_for_event(users, event, Shelter, '_shelter',
+        related=['shelter_provider'])
+
+class DailyHeadcount(models.Model):
+    """
+    Who is in camp on each day of an event, kept up to date as attendance
+    changes so the hot pages don't recount it on every request.
+    """
+    event = models.ForeignKey(Event)
+    day = models.DateField()
+
+    arriving = models.IntegerField(default=0)
+    arriving_breakfast = models.IntegerField(default=0)
+    arriving_dinner = models.IntegerField(default=0)
+    arriving_late = models.IntegerField(default=0)
+    departing = models.IntegerField(default=0)
+    departing_breakfast = models.IntegerField(default=0)
+    departing_dinner = models.IntegerField(default=0)
+    departing_late = models.IntegerField(default=0)
+    staying = models.IntegerField(default=0)
+    unconfirmed = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (('event', 'day'),)
+        ordering = ('event', 'day')
+
+    def __unicode__(self):
+        return '%s %s' % (self.event, self.day)
+
+class EventDataVersion(models.Model):
+    """
+    A counter bumped whenever something an event's pages show changes, so
+    they can be cached and answered conditionally by version.
+    """
+    event = models.OneToOneField(Event, primary_key=True,
+        related_name='data_version')
+    version = models.PositiveIntegerField(default=0)
+    changed = models.DateTimeField(default=timezone.now)
+
+    def __unicode__(self):
+        return '%s v%s' % (self.event, self.version)
+
 class Meal(models.Model):
     Breakfast = "Breakfast"
     Dinner = "Dinner"
@@ -270,7 +404,9 @@ class Meal(models.Model):
          (Bartend, "Night Bar")
     )
 
-    event = models.ForeignKey(Event, help_text="What year/regional is this for?")
+    # the composite index below leads with event.
+    event = models.ForeignKey(Event, db_index=False,
+        help_text="What year/regional is this for?")
     day = models.DateField()
     kind = models.CharField(choices=Kinds, default=Dinner, max_length=10)
     chef = models.ForeignKey(User, null=True)
@@ -281,6 +417,8 @@ class Meal(models.Model):
 
     class Meta:
         ordering = ('day', 'kind')
+        # an event's meals, already in order.
+        index_together = (('event', 'day', 'kind'),)
 
     def __unicode__(self):
         return "%s %s %s" % (self.event, self.day, self.kind)
@@ -310,6 +448,8 @@ class MealShift(models.Model):
 
     class Meta:
         ordering = ('meal', 'role', 'pk')
+        # one shift per worker per meal.
+        unique_together = (('meal', 'worker'),)
 
     def __unicode__(self):
         return "%s %s" % (self.meal, self.role)
@@ -321,7 +461,8 @@ def half_feet(start, stop):
 SIZE_CHOICES = half_feet(3, 30)
 
 class Shelter(models.Model):
-    user = models.OneToOneField(User)
+    user = models.ForeignKey(User)
+    event = models.ForeignKey(Event)
     date = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     sleeping_arrangement = models.CharField(max_length=25, choices=Sleeping_arrangements)
     shelter_provider = models.ForeignKey(User, blank=True, null=True, related_name='provided_shelter')
@@ -331,13 +472,17 @@ class Shelter(models.Model):
     width = models.FloatField(choices=SIZE_CHOICES, blank=True, null=True)
     length = models.FloatField(choices=SIZE_CHOICES, blank=True, null=True)
 
+    class Meta:
+        unique_together = (('user', 'event'),)
+
     def __unicode__(self):
         return '%s in %s' % (self.user, self.sleeping_arrangement)
 
 GIANT_SIZE_CHOICES = SIZE_CHOICES + half_feet(30, 99)
 
 class Vehicle(models.Model):
-    user = models.OneToOneField(User)
+    user = models.ForeignKey(User)
+    event = models.ForeignKey(Event)
     date = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     transit_arrangement = models.IntegerField(choices=Transit_arrangements)
     transit_provider = models.ForeignKey(User, blank=True, null=True, related_name='provided_transit')
@@ -347,6 +492,9 @@ class Vehicle(models.Model):
     width = models.FloatField(choices=SIZE_CHOICES, blank=True, null=True)
     length = models.FloatField(choices=GIANT_SIZE_CHOICES, blank=True, null=True)
 
+    class Meta:
+        unique_together = (('user', 'event'),)
+
     def __unicode__(self):
         return '%s, %s, %s, %s' %(
             self.user, self.transit_arrangement, self.model_of_car,
@@ -380,7 +528,8 @@ class BicycleMutationInventory(models.Model):
         return '%s %s %s'%(self.material, self.quantity, self.units)
 
 class BikeMutationSchedule(models.Model):
-    event = models.ForeignKey(Event)
+    # the composite index below leads with event.
+    event = models.ForeignKey(Event, db_index=False)
     shift = models.CharField(max_length=25, choices=PYB_shifts)
     worker = models.ForeignKey(User, null=True, blank=True, default=None)
     date = models.DateField()
@@ -388,6 +537,7 @@ class BikeMutationSchedule(models.Model):
 
     class Meta:
         ordering = ('event', 'date')
+        index_together = (('event', 'date', 'shift'),)
 
     def __unicode__(self):
         return '%s %s %s' % (self.shift, self.worker, self.date)
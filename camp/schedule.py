@@ -0,0 +1,170 @@
+from __future__ import absolute_import
+
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from .models import (Meal, BikeMutationSchedule, UserAttendance,
+    BREAKFAST_TIME, DINNER_TIME)
+
+
+def _local_date(value):
+    return timezone.localtime(value).date()
+
+def _transition_bucket(when):
+    hour = timezone.localtime(when).hour
+    if hour <= BREAKFAST_TIME:
+        return 'breakfast'
+    elif hour <= DINNER_TIME:
+        return 'dinner'
+    else:
+        return 'late'
+
+def dines_on(day, arrival, departure):
+    """
+    Whether a camper eats on a day: they've arrived by the midnight starting
+    it and haven't left before then.
+    """
+    midnight = timezone.make_aware(datetime.combine(day, time()),
+        timezone.get_default_timezone())
+    return arrival <= midnight <= departure
+
+def _empty_counts(days):
+    counts_by_day = []
+    for day in days:
+        counts = {'staying': 0, 'unconfirmed': 0}
+        for prefix in ('arriving', 'departing'):
+            counts[prefix] = 0
+            for bucket in ('breakfast', 'dinner', 'late'):
+                counts['%s_%s' % (prefix, bucket)] = 0
+        counts_by_day.append(counts)
+    return counts_by_day
+
+def attendance_counts(days, windows):
+    """
+    Build the calendar's per-day counts from (arrival, departure) pairs.
+
+    Arrivals and departures are bucketed by the day they happen on, and
+    everyone confirmed is swept across the days strictly between their
+    arrival and departure to find who is staying.
+    """
+    day_pos = {day: i for i, day in enumerate(days)}
+    counts_by_day = _empty_counts(days)
+    # +1 where a stay starts, -1 where it ends; the running sum is 'staying'.
+    stay_deltas = [0] * (len(days) + 1)
+    unconfirmed = 0
+
+    for arrival, departure in windows:
+        if arrival is not None:
+            pos = day_pos.get(_local_date(arrival))
+            if pos is not None:
+                counts = counts_by_day[pos]
+                counts['arriving'] += 1
+                counts['arriving_' + _transition_bucket(arrival)] += 1
+        if departure is not None:
+            pos = day_pos.get(_local_date(departure))
+            if pos is not None:
+                counts = counts_by_day[pos]
+                counts['departing'] += 1
+                counts['departing_' + _transition_bucket(departure)] += 1
+
+        if arrival is None or departure is None:
+            unconfirmed += 1
+            continue
+
+        arrival_date, departure_date = _local_date(arrival), _local_date(departure)
+        if not days or departure_date <= days[0] or days[-1] <= arrival_date:
+            continue
+        first = 0 if arrival_date < days[0] else day_pos[arrival_date] + 1
+        last = len(days) if departure_date > days[-1] else day_pos[departure_date]
+        if first < last:
+            stay_deltas[first] += 1
+            stay_deltas[last] -= 1
+
+    staying = 0
+    for pos, counts in enumerate(counts_by_day):
+        staying += stay_deltas[pos]
+        counts['staying'] = staying
+        counts['unconfirmed'] = unconfirmed
+
+    return counts_by_day
+
+def day_index(items, day_attr):
+    """
+    Map each day to the items falling on it, keeping queryset order.
+    """
+    index = defaultdict(list)
+    for item in items:
+        index[getattr(item, day_attr)].append(item)
+    return index
+
+def meal_index(event):
+    return day_index(Meal.objects.filter(event=event
+        ).order_by('day', 'kind'
+        ).select_related('chef'
+        ).prefetch_related('shifts__worker'), 'day')
+
+def bike_shift_index(event):
+    return day_index(BikeMutationSchedule.objects.filter(
+        event=event, worker__isnull=False).select_related('worker'), 'date')
+
+def build_calendar(event):
+    """
+    Context for calendar.html, in a fixed number of queries regardless of
+    how many days the event has.
+    """
+    from .headcount import headcounts
+
+    days = list(event.days)
+    meals = meal_index(event)
+    bike_shifts = bike_shift_index(event)
+
+    return {
+        'days': days,
+        'counts_by_day': headcounts(event),
+        'meals_by_day': [meals.get(day, []) for day in days],
+        'bike_shifts_by_day': [bike_shifts.get(day, []) for day in days],
+    }
+
+class DinerIndex(object):
+    """
+    Who is eating on each day of an event, loaded once per request.
+    """
+    def __init__(self, event):
+        attendances = UserAttendance.objects.attendees(event).filter(
+            arrival_date__isnull=False, departure_date__isnull=False
+            ).select_related('user'
+            ).prefetch_related('user__meal_restrictions'
+            ).order_by('user__last_name', 'user__first_name', 'user')
+        self._windows = [(a.arrival_date, a.departure_date, a.user)
+            for a in attendances]
+        self._summaries = {}
+
+    def diners(self, day):
+        return [camper for arrival, departure, camper in self._windows
+            if dines_on(day, arrival, departure)]
+
+    def summary(self, day):
+        """
+        (people_by_restriction, other_restrictions, num_served) for a day.
+        """
+        if day not in self._summaries:
+            self._summaries[day] = self._summarize(self.diners(day))
+        return self._summaries[day]
+
+    def _summarize(self, campers):
+        other_restrictions = []
+        people_by_restriction = defaultdict(list)
+        for camper in campers:
+            if camper.other_restrictions:
+                other_restrictions.append(camper.other_restrictions)
+            for restriction in camper.meal_restrictions.all():
+                people_by_restriction[restriction.name].append(camper.display_name)
+        if other_restrictions:
+            other_restrictions = ", ".join(other_restrictions)
+
+        for restriction in people_by_restriction:
+            people_by_restriction[restriction].sort()
+
+        return people_by_restriction, other_restrictions, len(campers)
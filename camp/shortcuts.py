@@ -1,18 +1,56 @@
+import threading
+import time
+
 from django.conf import settings
-from django.template import loader
-from django.template import RequestContext, Context
 
+# The current event is looked up all over (views, querysets, model
+# properties), so it's memoized for the duration of a request and cached
+# for the process; Event saves and deletes clear the process cache.
+_request_memo = threading.local()
+_process_cache = {}
+_stats = {'request_hits': 0, 'process_hits': 0, 'misses': 0}
 
-def render_template(request, template, context=None):
-    if not isinstance(template, list):
-        template = [template]
-    template = loader.select_template(template)
-    return template.render(context or {}, request=request)
+def start_request_memo(**kwargs):
+    _request_memo.events = {}
 
-def get_current_event():
+def end_request_memo(**kwargs):
+    _request_memo.events = None
+
+def clear_event_cache(**kwargs):
+    _process_cache.clear()
+    if getattr(_request_memo, 'events', None):
+        _request_memo.events = {}
+
+def event_cache_stats():
+    return dict(_stats)
+
+def _load_current_event():
     from camp.models import Event
 
     if settings.CURRENT_EVENT_ID is None:
         return Event.objects.order_by('-start_date').first()
     else:
         return Event.objects.filter(pk=settings.CURRENT_EVENT_ID).get()
+
+def get_current_event():
+    key = settings.CURRENT_EVENT_ID
+    memo = getattr(_request_memo, 'events', None)
+    if memo is not None and key in memo:
+        _stats['request_hits'] += 1
+        return memo[key]
+
+    cached = _process_cache.get(key)
+    if cached is not None and cached[1] > time.time():
+        _stats['process_hits'] += 1
+        event = cached[0]
+    else:
+        _stats['misses'] += 1
+        event = _load_current_event()
+        # other processes don't see our invalidations, so don't trust the
+        # process cache forever.
+        _process_cache[key] = (event,
+            time.time() + settings.CURRENT_EVENT_CACHE_SECONDS)
+
+    if memo is not None:
+        memo[key] = event
+    return event
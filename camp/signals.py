@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+
+from django.contrib.auth.models import Group
+from django.core.signals import request_started, request_finished
+from django.db.models.signals import (post_init, pre_save, post_save,
+    pre_delete, post_delete, m2m_changed)
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+
+from . import headcount, versions
+from .shortcuts import (start_request_memo, end_request_memo,
+    clear_event_cache)
+from .models import (BikeMutationSchedule, DailyHeadcount, Event, Meal,
+    MealShift, Shelter, User, UserAttendance, Vehicle,
+    forget_council_membership)
+
+
+request_started.connect(start_request_memo)
+request_finished.connect(end_request_memo)
+post_save.connect(clear_event_cache, sender=Event)
+post_delete.connect(clear_event_cache, sender=Event)
+
+@receiver(setting_changed)
+def current_event_setting_changed(setting, **kwargs):
+    if setting.startswith('CURRENT_EVENT_'):
+        clear_event_cache()
+
+@receiver(post_init, sender=UserAttendance)
+def remember_headcount_state(sender, instance, **kwargs):
+    instance._headcount_state = headcount.loaded_attendance_state(instance)
+
+@receiver(pre_save, sender=UserAttendance)
+@receiver(pre_delete, sender=UserAttendance)
+def resolve_headcount_state(sender, instance, **kwargs):
+    # loaded with .only() or .defer(), so read what is stored instead.
+    if instance._headcount_state == headcount.UNKNOWN:
+        instance._headcount_state = headcount.stored_attendance_state(instance.pk)
+
+@receiver(post_save, sender=UserAttendance)
+def attendance_saved(sender, instance, **kwargs):
+    new_state = headcount.attendance_state(instance)
+    headcount.update_for_attendance(instance._headcount_state, new_state)
+    instance._headcount_state = new_state
+
+@receiver(post_delete, sender=UserAttendance)
+def attendance_deleted(sender, instance, **kwargs):
+    headcount.update_for_attendance(instance._headcount_state, None)
+
+@receiver(m2m_changed, sender=User.meal_restrictions.through)
+def restrictions_changed(sender, action, **kwargs):
+    # restrictions show on the meal schedule and the camper list.
+    if action.startswith('post_'):
+        versions.data_changed()
+
+@receiver(post_save, sender=Event)
+def event_saved(sender, instance, created, **kwargs):
+    # days may have moved; the next read rebuilds them.
+    if not created:
+        DailyHeadcount.objects.filter(event=instance).delete()
+    versions.data_changed([instance.pk])
+
+@receiver(post_save, sender=MealShift)
+@receiver(post_delete, sender=MealShift)
+def meal_shift_changed(sender, instance, **kwargs):
+    versions.data_changed(meal_ids=[instance.meal_id])
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # names show on the board; logging in only touches last_login.
+    if update_fields == frozenset(['last_login']):
+        return
+    versions.data_changed()
+
+@receiver(post_save, sender=UserAttendance)
+@receiver(post_delete, sender=UserAttendance)
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+@receiver(post_save, sender=BikeMutationSchedule)
+@receiver(post_delete, sender=BikeMutationSchedule)
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_save, sender=Shelter)
+@receiver(post_delete, sender=Shelter)
+def event_data_changed(sender, instance, **kwargs):
+    versions.data_changed([instance.event_id])
+
+@receiver(m2m_changed, sender=User.groups.through)
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            forget_council_membership([instance.pk])
+    elif action == 'pre_clear':
+        forget_council_membership(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        forget_council_membership(pk_set)
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # a renamed or deleted group may have been (or become) the council.
+    forget_council_membership(instance.user_set.values_list('pk', flat=True))
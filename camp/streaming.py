@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+
+import struct
+import time
+import zlib
+from cStringIO import StringIO
+
+import unicodecsv
+from django.db.models import Q
+
+
+def _after(keys, values):
+    """
+    A filter for rows after the given values of some ascending keys, in
+    their order: the first key greater, or equal with the next key greater,
+    and so on.
+    """
+    after = Q()
+    for i, key in enumerate(keys):
+        later = Q(**{key + '__gt': values[i]})
+        for earlier, value in zip(keys[:i], values):
+            later &= Q(**{earlier: value})
+        after |= later
+    return after
+
+def queryset_chunks(qs, chunk_size=500, ordering=()):
+    """
+    Iterate a queryset as lists of up to chunk_size objects, in the order of
+    the given (ascending, non-null) fields and then primary key. Each chunk
+    starts after the last one's keys rather than at an offset. Unlike
+    .iterator(), prefetch_related still applies to each chunk.
+    """
+    keys = tuple(ordering) + ('pk',)
+    qs = qs.order_by(*keys)
+    last = None
+    while True:
+        chunk_qs = qs if last is None else qs.filter(_after(keys, last))
+        chunk = list(chunk_qs[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = [getattr(chunk[-1], key) for key in keys]
+
+def csv_chunks(header, rows, rows_per_chunk=500):
+    """
+    Write rows as CSV, yielding the encoded text every rows_per_chunk rows.
+    """
+    buf = StringIO()
+    writer = unicodecsv.writer(buf)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % rows_per_chunk == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+class ZipStream(object):
+    """
+    Writes a zip archive as a stream of bytes, one member at a time.
+
+    zipfile needs to seek back to fill in each member's sizes, so it can't
+    write to a response. Here sizes and checksums follow the data in a data
+    descriptor instead, as the format allows. No zip64, so members must stay
+    under 4GB.
+    """
+    LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+    DATA_DESCRIPTOR = struct.Struct('<4s3L')
+    CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+    END_RECORD = struct.Struct('<4s4H2LH')
+
+    VERSION = 20
+    FLAGS = 0x08 # sizes and crc are in the data descriptor
+    DEFLATED = 8
+
+    def __init__(self, compresslevel=6):
+        self.compresslevel = compresslevel
+        self._members = []
+        self._offset = 0
+
+    def _dos_time(self, when):
+        t = time.gmtime(when)
+        dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+        dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+        return dos_time, dos_date
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def member(self, name, chunks, when=None):
+        """
+        Yield the bytes for one member whose contents are the given chunks.
+        """
+        name = name.encode('utf-8')
+        dos_time, dos_date = self._dos_time(when or time.time())
+        header_offset = self._offset
+
+        yield self._emit(self.LOCAL_HEADER.pack(b'PK\x03\x04',
+            self.VERSION, 0, self.FLAGS, self.DEFLATED, dos_time, dos_date,
+            0, 0, 0, len(name), 0) + name)
+
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+        crc = size = compressed_size = 0
+        for chunk in chunks:
+            if not chunk:
+                continue
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            compressed = compressor.compress(chunk)
+            if compressed:
+                compressed_size += len(compressed)
+                yield self._emit(compressed)
+        compressed = compressor.flush()
+        compressed_size += len(compressed)
+        crc &= 0xffffffff
+
+        yield self._emit(compressed + self.DATA_DESCRIPTOR.pack(b'PK\x07\x08',
+            crc, compressed_size, size))
+
+        self._members.append((name, dos_time, dos_date, crc,
+            compressed_size, size, header_offset))
+
+    def close(self):
+        """
+        Yield the central directory, which ends the archive.
+        """
+        directory_offset = self._offset
+        for (name, dos_time, dos_date, crc, compressed_size, size,
+                header_offset) in self._members:
+            yield self._emit(self.CENTRAL_HEADER.pack(b'PK\x01\x02',
+                self.VERSION, 3, self.VERSION, 0, self.FLAGS, self.DEFLATED,
+                dos_time, dos_date, crc, compressed_size, size, len(name),
+                0, 0, 0, 0, 0o644 << 16, header_offset) + name)
+
+        yield self._emit(self.END_RECORD.pack(b'PK\x05\x06', 0, 0,
+            len(self._members), len(self._members),
+            self._offset - directory_offset, directory_offset, 0))
@@ -1,12 +1,57 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import datetime
+import json
+import logging
+import threading
+import zipfile
+from cStringIO import StringIO
 
-from . import factories
+import unicodecsv
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import connection, connections
+from django.db.models import F
+from django.db.transaction import atomic
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+from . import (benchmark, board, claims, factories, instrumentation, to_csv,
+    versions, views)
+from .custom_auth import EmailOrUsernameModelBackend
 from .forms import ChefForm
+from .headcount import headcounts, rebuild_headcounts
+from .schedule import build_calendar
+from .shortcuts import (get_current_event, event_cache_stats,
+    start_request_memo, end_request_memo)
 from .views import _maintain_meal_requirements
-from .models import MealShift
+from .models import (Bike, BikeMutationSchedule, DailyHeadcount, Event,
+    EventDataVersion, Meal, MealRestriction, MealShift, Shelter, User,
+    UserAttendance, Vehicle,
+    COUNCIL_GROUP, DRIVING, RIDING_WITH, UNDETERMINED, Morning,
+    bringing_own_tent, sharing_someone_elses, undetermined)
+
+
+# Render pages without collected static files or an HTTPS redirect.
+view_settings = override_settings(SECURE_SSL_REDIRECT=False,
+    STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+
+# the per-request timing log would drown out test output.
+logging.getLogger('camp.instrumentation').setLevel(logging.WARNING)
+
+
+def _at(year, month, day, hour):
+    return datetime.datetime(year, month, day, hour, tzinfo=timezone.utc)
 
 
 class ChefRequirementsTestCase(TestCase):
@@ -27,7 +72,9 @@ class ChefRequirementsTestCase(TestCase):
         meal = factories.MealFactory(event=self.event)
         form = self._make_form(meal, True, 2, 3)
 
-        _maintain_meal_requirements(meal, form)
+        # read shifts, insert shifts, save meal
+        with self.assertNumQueries(3):
+            _maintain_meal_requirements(meal, form)
 
         self.assertEqual(1,
             meal.shifts.filter(role=MealShift.Courier).count())
@@ -51,7 +98,10 @@ class ChefRequirementsTestCase(TestCase):
 
         form = self._make_form(meal, False, 1, 1)
 
-        _maintain_meal_requirements(meal, form)
+        # read shifts, collect and delete shifts (so the shift board hears
+        # about it), save meal
+        with self.assertNumQueries(4):
+            _maintain_meal_requirements(meal, form)
 
         self.assertEqual(0,
             meal.shifts.filter(role=MealShift.Courier).count())
@@ -63,6 +113,19 @@ class ChefRequirementsTestCase(TestCase):
         # the only kp shift left is the one that was already filled.
         self.assertTrue(meal.shifts.filter(pk=kp_shift.pk).exists())
 
+    def test_revising_removes_newest_assigned(self):
+        meal = factories.MealFactory(event=self.event)
+        _maintain_meal_requirements(meal, self._make_form(meal, False, 0, 3))
+        kp_shifts = list(meal.shifts.filter(role=MealShift.KP).order_by('pk'))
+        for shift in kp_shifts:
+            shift.worker = factories.UserFactory()
+            shift.save()
+
+        _maintain_meal_requirements(meal, self._make_form(meal, False, 0, 1))
+
+        self.assertEqual([kp_shifts[0].pk],
+            list(meal.shifts.values_list('pk', flat=True)))
+
     def test_revising_increase(self):
         meal = factories.MealFactory(event=self.event)
         form = self._make_form(meal, True, 1, 1)
@@ -79,3 +142,1332 @@ class ChefRequirementsTestCase(TestCase):
             meal.shifts.filter(role=MealShift.Sous_Chef).count())
         self.assertEqual(3,
             meal.shifts.filter(role=MealShift.KP).count())
+
+
+class CalendarTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+
+    def _attend(self, arrival, departure, camping=True):
+        return UserAttendance.objects.create(
+            user=factories.UserFactory(), event=self.event,
+            arrival_date=arrival, departure_date=departure,
+            camping_this_year=camping)
+
+    def test_counts(self):
+        self._attend(_at(2019, 8, 21, 9), _at(2019, 8, 24, 20))
+        self._attend(_at(2019, 8, 22, 18), _at(2019, 8, 26, 9))
+        self._attend(_at(2019, 8, 22, 22), None)
+        self._attend(_at(2019, 8, 21, 9), _at(2019, 8, 22, 9), camping=False)
+
+        counts = build_calendar(self.event)['counts_by_day']
+
+        self.assertEqual([0, 1, 2, 0, 0, 0, 0],
+            [c['arriving'] for c in counts])
+        self.assertEqual(1, counts[1]['arriving_breakfast'])
+        self.assertEqual(1, counts[2]['arriving_dinner'])
+        self.assertEqual(1, counts[2]['arriving_late'])
+        self.assertEqual([0, 0, 0, 0, 1, 0, 1],
+            [c['departing'] for c in counts])
+        # by the hour they leave, not the hour they came.
+        self.assertEqual(1, counts[4]['departing_late'])
+        self.assertEqual(1, counts[6]['departing_breakfast'])
+        self.assertEqual(0, sum(c['departing_dinner'] for c in counts))
+        self.assertEqual([0, 0, 1, 2, 1, 1, 0],
+            [c['staying'] for c in counts])
+        self.assertEqual([1] * 7, [c['unconfirmed'] for c in counts])
+
+    def test_constant_queries(self):
+        def num_queries(event):
+            for day in list(event.days)[:3]:
+                meal = factories.MealFactory(event=event, day=day)
+                factories.MealShiftFactory(meal=meal,
+                    worker=factories.UserFactory())
+                BikeMutationSchedule.objects.create(event=event, date=day,
+                    shift=Morning, worker=factories.UserFactory())
+            with CaptureQueriesContext(connection) as ctx:
+                build_calendar(event)
+            return len(ctx.captured_queries)
+
+        short = num_queries(self.event)
+        longer = num_queries(factories.EventFactory(
+            start_date=datetime.date(2020, 8, 20),
+            end_date=datetime.date(2020, 9, 10)))
+        self.assertEqual(short, longer)
+
+    def test_other_events_excluded(self):
+        day = datetime.date(2019, 8, 22)
+        other = factories.EventFactory(start_date=day,
+            end_date=datetime.date(2019, 8, 25))
+        mine = factories.MealFactory(event=self.event, day=day)
+        factories.MealFactory(event=other, day=day)
+        BikeMutationSchedule.objects.create(event=other, date=day,
+            shift=Morning, worker=factories.UserFactory())
+
+        context = build_calendar(self.event)
+
+        self.assertEqual([[mine]], [m for m in context['meals_by_day'] if m])
+        self.assertEqual([], [s for s in context['bike_shifts_by_day'] if s])
+
+
+@view_settings
+class MealScheduleTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+        self.vegan = MealRestriction.objects.create(name='Vegan')
+        self.viewer = factories.UserFactory()
+        self.client.force_login(self.viewer)
+
+    def _camper(self, arrival, departure, restrictions=(), other=''):
+        camper = factories.UserFactory(other_restrictions=other)
+        camper.meal_restrictions.set(restrictions)
+        UserAttendance.objects.create(user=camper, event=self.event,
+            arrival_date=arrival, departure_date=departure,
+            camping_this_year=True)
+        return camper
+
+    def test_diners(self):
+        vegan = self._camper(_at(2019, 8, 21, 9), _at(2019, 8, 24, 9),
+            restrictions=[self.vegan], other='no figs')
+        self._camper(_at(2019, 8, 22, 9), _at(2019, 8, 24, 9))
+        factories.MealFactory(event=self.event, day=datetime.date(2019, 8, 22))
+        factories.MealFactory(event=self.event, day=datetime.date(2019, 8, 23))
+
+        response = self.client.get(reverse('meal_schedule'))
+
+        first, second = response.context['shifts_by_meal']
+        self.assertEqual(1, first['num_served'])
+        self.assertEqual({'Vegan': [vegan.display_name]}, first['restrictions'])
+        self.assertEqual('no figs', first['other_restrictions'])
+        self.assertEqual(2, second['num_served'])
+
+    def test_constant_queries(self):
+        def add_meals(days):
+            for day in days:
+                camper = self._camper(_at(2019, 8, 20, 9), _at(2019, 8, 26, 9),
+                    restrictions=[self.vegan])
+                meal = factories.MealFactory(event=self.event, day=day)
+                factories.MealShiftFactory(meal=meal, worker=camper)
+
+        # warm the current event and council caches.
+        self.client.get(reverse('meal_schedule'))
+
+        # session, user, data version, attendance, restrictions, meals,
+        # shifts, workers
+        add_meals([datetime.date(2019, 8, 21)])
+        with self.assertNumQueries(8):
+            self.client.get(reverse('meal_schedule'))
+
+        add_meals([datetime.date(2019, 8, 22 + i) for i in range(4)])
+        with self.assertNumQueries(8):
+            self.client.get(reverse('meal_schedule'))
+
+
+@view_settings
+class MealShiftsTestCase(TransactionTestCase):
+    # the board is cached under data versions, which only move on commit.
+    def setUp(self):
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+        self.viewer = factories.UserFactory()
+        self.client.force_login(self.viewer)
+        cache.clear()
+
+    def _meal(self, day, chef=None):
+        meal = factories.MealFactory(event=self.event, day=day, chef=chef)
+        for role in (MealShift.Sous_Chef, MealShift.KP):
+            factories.MealShiftFactory(meal=meal, role=role,
+                worker=factories.UserFactory())
+        factories.MealShiftFactory(meal=meal, role=MealShift.KP)
+        return meal
+
+    def test_board(self):
+        cheffing = self._meal(datetime.date(2019, 8, 21), chef=self.viewer)
+        working = self._meal(datetime.date(2019, 8, 22))
+        mine = working.shifts.filter(worker__isnull=True).get()
+        mine.worker = self.viewer
+        mine.save()
+
+        response = self.client.get(reverse('meal_shifts'))
+
+        first, second = [entry for meals in response.context['meals_by_day']
+            for entry in meals]
+        self.assertEqual(board.MINE, first['chef'])
+        self.assertEqual([board.CHEF] * 3,
+            [state for state, shift in first['shifts']])
+        self.assertEqual(board.OPEN, second['chef'])
+        self.assertEqual([board.OTHER, board.MINE, board.OTHER],
+            [state for state, shift in second['shifts']])
+        self.assertContains(response, 'Update requirements')
+        self.assertContains(response, 'Chef this meal')
+        self.assertContains(response, 'Quit as KP')
+        self.assertNotContains(response, board.CSRF_PLACEHOLDER)
+        # one more for the form that saves marked shifts in one request.
+        self.assertContains(response, 'csrfmiddlewaretoken', count=5)
+        self.assertContains(response, reverse('claim_shifts'))
+        self.assertContains(response, 'data-field="release_meal_shift" data-shift="%s"'
+            % mine.pk)
+
+    def test_cached(self):
+        meal = self._meal(datetime.date(2019, 8, 21))
+        self.client.get(reverse('meal_shifts'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('meal_shifts'))
+        self.assertFalse([q for q in ctx if 'camp_mealshift' in q['sql']])
+
+        # another camper signs up
+        shift = meal.shifts.filter(worker__isnull=True).get()
+        worker = factories.UserFactory(first_name='Fennel')
+        claims.claim_meal_shift(shift.pk, worker)
+        self.assertContains(self.client.get(reverse('meal_shifts')), 'Fennel')
+
+        worker.first_name = 'Juniper'
+        worker.save()
+        self.assertContains(self.client.get(reverse('meal_shifts')), 'Juniper')
+
+        meal.kind = 'Dinner'
+        meal.save()
+        self.assertContains(self.client.get(reverse('meal_shifts')), 'Dinner')
+
+        shift.delete()
+        response = self.client.get(reverse('meal_shifts'))
+        self.assertNotContains(response, 'Juniper')
+
+    def test_cached_under_data_version(self):
+        meal = self._meal(datetime.date(2019, 8, 21))
+        worker = factories.UserFactory(first_name='Fennel')
+        self.assertNotContains(self.client.get(reverse('meal_shifts')), 'Fennel')
+
+        # another process claims the shift: this one's cache is never told,
+        # but the version in the database moves on.
+        MealShift.objects.filter(meal=meal, worker__isnull=True).update(
+            worker=worker)
+        EventDataVersion.objects.filter(event=self.event).update(
+            version=F('version') + 1)
+
+        self.assertContains(self.client.get(reverse('meal_shifts')), 'Fennel')
+
+    def test_constant_queries(self):
+        self.client.get(reverse('meal_shifts'))
+
+        self._meal(datetime.date(2019, 8, 21), chef=self.viewer)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('meal_shifts'))
+
+        for i in range(5):
+            self._meal(datetime.date(2019, 8, 22 + i),
+                chef=factories.UserFactory())
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('meal_shifts'))
+        self.assertEqual(len(few), len(many))
+
+
+class HeadcountTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+        self.campers = [factories.UserFactory() for i in range(3)]
+        # build the (empty) table so later changes apply incrementally.
+        headcounts(self.event)
+
+    def _rebuilt(self):
+        incremental = headcounts(self.event)
+        rebuild_headcounts(self.event)
+        return incremental, headcounts(self.event)
+
+    def test_incremental_matches_rebuild(self):
+        first, second, third = self.campers
+        attendance = UserAttendance.objects.create(user=first,
+            event=self.event, camping_this_year=True,
+            arrival_date=_at(2019, 8, 21, 9), departure_date=_at(2019, 8, 25, 9))
+        UserAttendance.objects.create(user=second, event=self.event,
+            camping_this_year=True, arrival_date=_at(2019, 8, 22, 20))
+        other = UserAttendance.objects.create(user=third, event=self.event,
+            camping_this_year=True, arrival_date=_at(2019, 8, 20, 9),
+            departure_date=_at(2019, 8, 26, 9))
+
+        attendance.departure_date = _at(2019, 8, 23, 21)
+        attendance.save()
+        other.delete()
+
+        incremental, rebuilt = self._rebuilt()
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual([0, 0, 1, 0, 0, 0, 0],
+            [c['staying'] for c in incremental])
+
+    def test_not_camping(self):
+        attendance = UserAttendance.objects.create(user=self.campers[0],
+            event=self.event, camping_this_year=True,
+            arrival_date=_at(2019, 8, 21, 9), departure_date=_at(2019, 8, 25, 9))
+        self.assertEqual(1, headcounts(self.event)[1]['arriving'])
+
+        attendance.camping_this_year = False
+        attendance.save()
+
+        incremental, rebuilt = self._rebuilt()
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(0, incremental[1]['arriving'])
+
+    def test_one_update_per_save(self):
+        attendance = UserAttendance.objects.create(user=self.campers[0],
+            event=self.event, camping_this_year=True,
+            arrival_date=_at(2019, 8, 21, 9), departure_date=_at(2019, 8, 25, 9))
+
+        attendance.arrival_date = _at(2019, 8, 22, 20)
+        attendance.departure_date = None
+        with CaptureQueriesContext(connection) as ctx:
+            attendance.save()
+        headcount_queries = [q['sql'] for q in ctx.captured_queries
+            if 'camp_dailyheadcount' in q['sql'] or 'camp_event"' in q['sql']]
+        self.assertEqual(1, len(headcount_queries), headcount_queries)
+
+        incremental, rebuilt = self._rebuilt()
+        self.assertEqual(rebuilt, incremental)
+
+    def test_deferred_fields(self):
+        UserAttendance.objects.create(user=self.campers[0], event=self.event,
+            camping_this_year=True, arrival_date=_at(2019, 8, 21, 9),
+            departure_date=_at(2019, 8, 25, 9))
+
+        # loading doesn't fetch the deferred fields one by one.
+        with self.assertNumQueries(1):
+            attendance = UserAttendance.objects.only('pk').get()
+        attendance.arrival_date = _at(2019, 8, 22, 9)
+        attendance.save()
+
+        incremental, rebuilt = self._rebuilt()
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual([0, 0, 1, 0, 0, 0, 0],
+            [c['arriving'] for c in incremental])
+
+
+class CurrentEventCacheTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory()
+
+    def test_process_cache(self):
+        self.assertEqual(self.event, get_current_event())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.event, get_current_event())
+
+        later = factories.EventFactory(
+            start_date=self.event.start_date + datetime.timedelta(days=365))
+        self.assertEqual(later, get_current_event())
+
+    def test_request_memo(self):
+        before = event_cache_stats()
+        start_request_memo()
+        try:
+            get_current_event()
+            get_current_event()
+        finally:
+            end_request_memo()
+        after = event_cache_stats()
+
+        self.assertEqual(1, after['request_hits'] - before['request_hits'])
+
+    def test_setting(self):
+        other = factories.EventFactory(
+            start_date=self.event.start_date - datetime.timedelta(days=365))
+        get_current_event()
+        with self.settings(CURRENT_EVENT_ID=other.pk):
+            self.assertEqual(other, get_current_event())
+
+
+@view_settings
+class AttendanceTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory()
+        self.viewer = factories.UserFactory()
+        self.client.force_login(self.viewer)
+
+    def test_campers_does_not_write(self):
+        for i in range(3):
+            factories.UserFactory()
+        UserAttendance.objects.create(user=self.viewer, event=self.event,
+            camping_this_year=True, arrival_date=_at(2019, 8, 21, 9),
+            departure_date=_at(2019, 8, 25, 9))
+
+        response = self.client.get(reverse('campers'), {'all': 1})
+
+        self.assertEqual(1, UserAttendance.objects.count())
+        attendances = {c.pk: c.attendance for c in response.context['campers']}
+        self.assertEqual(4, len(attendances))
+        self.assertIsNotNone(attendances[self.viewer.pk].pk)
+        self.assertEqual(1, len([a for a in attendances.values() if a.pk]))
+
+    def test_campers_constant_queries(self):
+        def num_queries():
+            for i in range(3):
+                UserAttendance.objects.create(user=factories.UserFactory(),
+                    event=self.event, camping_this_year=True)
+            self.client.get(reverse('campers'))
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('campers'))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(num_queries(), num_queries())
+
+    def test_profile_save_creates_attendance(self):
+        self.client.get(reverse('profile'))
+        self.assertFalse(UserAttendance.objects.exists())
+
+        self.client.post(reverse('profile'), {
+            'email': self.viewer.email,
+            'camping_this_year': 'on',
+        })
+
+        attendance = UserAttendance.objects.get()
+        self.assertEqual(self.viewer, attendance.user)
+        self.assertEqual(self.event, attendance.event)
+        self.assertTrue(attendance.camping_this_year)
+
+
+class CouncilTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.council = Group.objects.get(name=COUNCIL_GROUP)
+        self.user = factories.UserFactory()
+
+    def _fresh(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_cached(self):
+        self.assertFalse(self._fresh().is_council)
+        user = self._fresh()
+        with self.assertNumQueries(0):
+            self.assertFalse(user.is_council)
+
+    def test_invalidated_by_membership(self):
+        self.assertFalse(self._fresh().is_council)
+
+        self.user.groups.add(self.council)
+        self.assertTrue(self._fresh().is_council)
+
+        self.council.user_set.remove(self.user)
+        self.assertFalse(self._fresh().is_council)
+
+    def test_invalidated_by_rename(self):
+        other = Group.objects.create(name='Elders')
+        self.user.groups.add(other)
+        self.assertFalse(self._fresh().is_council)
+
+        self.council.name = 'Former council'
+        self.council.save()
+        other.name = COUNCIL_GROUP
+        other.save()
+        self.assertTrue(self._fresh().is_council)
+
+
+@view_settings
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.event = factories.EventFactory()
+        self.staff = factories.UserFactory(is_staff=True)
+        self.client.force_login(self.staff)
+
+    def _archive(self, **params):
+        response = self.client.get(reverse('export'), params)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(StringIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        return archive
+
+    def _read(self, archive, name):
+        return list(unicodecsv.reader(StringIO(archive.read(name))))
+
+    def _export(self):
+        archive = self._archive()
+        name, = archive.namelist()
+        return self._read(archive, name)
+
+    def test_rows_across_chunks(self):
+        # created out of name order, with ties that only the pk breaks.
+        for first, last in [('Zo\xeb 5', 'Moss'), ('Ash', 'Moss'),
+                ('Zo\xeb 2', 'Aster'), ('Ash', 'Moss'), ('Ash', 'Moss'),
+                ('Bea', 'Aster')]:
+            factories.UserFactory(first_name=first, last_name=last)
+
+        old_chunk_size = views.EXPORT_CHUNK_SIZE
+        views.EXPORT_CHUNK_SIZE = 3
+        try:
+            rows = self._export()
+        finally:
+            views.EXPORT_CHUNK_SIZE = old_chunk_size
+
+        header, rows = rows[0], rows[1:]
+        self.assertEqual('first_name', header[0])
+        self.assertEqual(7, len(rows))
+        self.assertEqual([user.email for user in User.objects.order_by(
+            'last_name', 'first_name', 'pk')], [row[2] for row in rows])
+
+    def test_full_dump(self):
+        camper = factories.UserFactory()
+        camper.meal_restrictions.add(MealRestriction.objects.create(name='Vegan'))
+        factories.MealShiftFactory(meal__event=self.event, worker=camper)
+
+        archive = self._archive(full=1)
+
+        members = {name.split('/')[-1]: name for name in archive.namelist()}
+        self.assertEqual(len(to_csv.DUMP_MODELS), len(members))
+
+        users = self._read(archive, members['camp_user.csv'])
+        self.assertNotIn('password', users[0])
+        self.assertEqual(3, len(users))
+        self.assertEqual(2, len(self._read(archive, members['camp_mealshift.csv'])))
+        restrictions = self._read(archive, members['camp_user_meal_restrictions.csv'])
+        self.assertEqual([str(camper.pk)], [row[1] for row in restrictions[1:]])
+
+    def test_constant_queries(self):
+        def num_queries(n):
+            for i in range(n):
+                driver = factories.UserFactory()
+                Vehicle.objects.create(user=driver, event=self.event,
+                    transit_arrangement=DRIVING)
+                Shelter.objects.create(user=driver, event=self.event,
+                    sleeping_arrangement=bringing_own_tent)
+                camper = factories.UserFactory(sponsor=driver)
+                Vehicle.objects.create(user=camper, event=self.event,
+                    transit_arrangement=RIDING_WITH, transit_provider=driver)
+                Shelter.objects.create(user=camper, event=self.event,
+                    sleeping_arrangement=sharing_someone_elses, shelter_provider=driver)
+                UserAttendance.objects.create(user=camper, event=self.event)
+            self._export()
+            with CaptureQueriesContext(connection) as ctx:
+                rows = self._export()
+            self.assertEqual(User.objects.count() + 1, len(rows))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(num_queries(1), num_queries(5))
+
+
+@view_settings
+class ProviderSearchTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = factories.EventFactory()
+        self.camper = factories.UserFactory(first_name='Kit', last_name='Moss')
+        self.client.force_login(self.camper)
+        self.drivers = [factories.UserFactory(first_name=first, last_name=last,
+                playa_name=playa)
+            for first, last, playa in [('Ash', 'Boyd', ''), ('Bea', 'Ashe', ''),
+                ('Cal', 'Diaz', 'Ashtray'), ('Dee', 'Shaw', '')]]
+        for user in self.drivers + [self.camper]:
+            factories.VehicleFactory(user=user, event=self.event,
+                transit_arrangement=DRIVING)
+        # not driving, so nobody can ride with them.
+        factories.VehicleFactory(user=factories.UserFactory(first_name='Ashley'),
+            event=self.event, transit_arrangement=RIDING_WITH,
+            transit_provider=self.drivers[0])
+
+    def _search(self, term, kind='transit'):
+        response = self.client.get(reverse('provider_search',
+            kwargs={'kind': kind}), {'term': term})
+        self.assertEqual(200, response.status_code)
+        return [result['label'] for result in json.loads(response.content)['results']]
+
+    def test_prefixes(self):
+        self.assertEqual(['Ash Boyd', 'Bea Ashe', 'Cal Diaz (Ashtray)'],
+            self._search('ash'))
+        self.assertEqual(['Ash Boyd'], self._search('ash bo'))
+        self.assertEqual([], self._search('hay'))
+        # everyone but yourself.
+        self.assertEqual(4, len(self._search('')))
+        self.assertEqual([], self._search('kit'))
+
+    def test_limited(self):
+        for i in range(views.PROVIDER_SEARCH_RESULTS):
+            factories.ShelterFactory(event=self.event,
+                user=factories.UserFactory(first_name='Tent%s' % i))
+
+        self.assertEqual(views.PROVIDER_SEARCH_RESULTS,
+            len(self._search('tent', kind='shelter')))
+        self.assertEqual(404, self.client.get(reverse('provider_search',
+            kwargs={'kind': 'bike'})).status_code)
+
+    def test_cached(self):
+        url = reverse('provider_search', kwargs={'kind': 'transit'})
+        response = self.client.get(url, {'term': 'ash'})
+        self.assertIn('max-age', response['Cache-Control'])
+
+        with self.assertNumQueries(3):
+            # session, user and data version; the results come from the cache.
+            self.client.get(url, {'term': 'ASH '})
+        self.assertEqual(304, self.client.get(url, {'term': 'ash'},
+            HTTP_IF_NONE_MATCH=response['ETag']).status_code)
+
+    def test_form(self):
+        response = self.client.get(reverse('vehicle'))
+        # no choices to pick from, only a search box.
+        self.assertNotContains(response, 'Dee Shaw')
+        self.assertContains(response, 'class="provider-search"')
+
+        def post(provider):
+            return self.client.post(reverse('vehicle'), {
+                'transit_arrangement': RIDING_WITH,
+                'transit_provider': provider.pk})
+
+        self.assertEqual(302, post(self.drivers[1]).status_code)
+        self.assertEqual(self.drivers[1], Vehicle.objects.get(
+            user=self.camper, event=self.event).transit_provider)
+        # only drivers, and not yourself.
+        self.assertEqual(200, post(self.camper).status_code)
+        response = self.client.get(reverse('vehicle'))
+        self.assertContains(response, 'value="Bea Ashe"')
+
+
+class HappyNewYearTestCase(TestCase):
+    args = ['2019-08-21', '2019-09-03', '2019-08-27', '2019-08-31',
+        '2019-08-26', '2019-09-01', '2019-08-26', '2019-08-29']
+
+    def test_provisions_event(self):
+        call_command('happy_new_year', *self.args, interactive=False,
+            stdout=StringIO())
+
+        event = Event.objects.get(name='Burning Man 2019')
+        meals = Meal.objects.filter(event=event)
+        # 11 days between the first and last, plus 5 bbqs and 7 bars.
+        self.assertEqual(11 * 2 + 5 + 7, meals.count())
+        self.assertEqual(meals.count(), MealShift.objects.filter(
+            meal__event=event, role=MealShift.Chef).count())
+        self.assertFalse(meals.exclude(shifts__role=MealShift.Chef).exists())
+        self.assertEqual(4 * 2 * 4,
+            BikeMutationSchedule.objects.filter(event=event).count())
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('happy_new_year', *self.args, interactive=False,
+            dry_run=True, stdout=out)
+
+        self.assertFalse(Event.objects.filter(name='Burning Man 2019').exists())
+        self.assertIn('34 meals, 34 chef shifts, 32 bike shifts', out.getvalue())
+
+    def test_carries_over_shelters_and_vehicles(self):
+        last_year = factories.EventFactory(start_date=datetime.date(2018, 8, 22))
+        camper = factories.UserFactory()
+        Shelter.objects.create(user=camper, event=last_year,
+            sleeping_arrangement=bringing_own_tent, width=10.0, length=12.0)
+        Vehicle.objects.create(user=camper, event=last_year,
+            transit_arrangement=DRIVING, make_of_car='VW', model_of_car='Bus')
+        friend = factories.UserFactory()
+        Shelter.objects.create(user=friend, event=last_year,
+            sleeping_arrangement=sharing_someone_elses, shelter_provider=camper)
+        Vehicle.objects.create(user=friend, event=last_year,
+            transit_arrangement=RIDING_WITH, transit_provider=camper)
+
+        call_command('happy_new_year', *self.args, interactive=False,
+            stdout=StringIO())
+
+        event = Event.objects.get(name='Burning Man 2019')
+        shelter = Shelter.objects.get(user=camper, event=event)
+        self.assertEqual(undetermined, shelter.sleeping_arrangement)
+        self.assertEqual((10.0, 12.0), (shelter.width, shelter.length))
+        vehicle = Vehicle.objects.get(user=camper, event=event)
+        self.assertEqual(UNDETERMINED, vehicle.transit_arrangement)
+        self.assertEqual('Bus', vehicle.model_of_car)
+        # last year's ride and tent partners aren't this year's.
+        self.assertIsNone(Shelter.objects.get(user=friend, event=event).shelter_provider)
+        self.assertIsNone(Vehicle.objects.get(user=friend, event=event).transit_provider)
+        # last year is left as it was.
+        self.assertEqual(bringing_own_tent, Shelter.objects.get(
+            user=camper, event=last_year).sleeping_arrangement)
+
+
+@view_settings
+class BenchmarkTestCase(TestCase):
+    def test_measure(self):
+        event = factories.EventFactory()
+        factories.UserAttendanceFactory(event=event)
+        self.client.force_login(factories.UserFactory(is_staff=True))
+
+        stats = benchmark.measure(self.client, reverse('export'), repeat=3)
+
+        self.assertEqual(set(benchmark.STATS), set(stats))
+        self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+        # the export streams, and its queries are counted as it does.
+        self.assertGreater(stats['queries'], 2)
+
+    def test_cold(self):
+        factories.MealShiftFactory(meal=factories.MealFactory(
+            event=factories.EventFactory()))
+        self.client.force_login(factories.UserFactory(is_staff=True))
+        url = reverse('meal_shifts')
+
+        warm = benchmark.measure(self.client, url, repeat=2)
+        cold = benchmark.measure(self.client, url, repeat=2, cold=True)
+
+        # the cached shift board skips its queries only when warm.
+        self.assertGreater(cold['queries'], warm['queries'])
+
+    def test_compare(self):
+        baseline = {'100': {
+            'calendar': {
+                'cold': {'p50_ms': 20, 'p95_ms': 30, 'queries': 3},
+                'warm': {'p50_ms': 10, 'p95_ms': 20, 'queries': 2},
+            },
+            'campers': {
+                'cold': {'p50_ms': 2, 'p95_ms': 3, 'queries': 6},
+                'warm': {'p50_ms': 2, 'p95_ms': 3, 'queries': 6},
+            },
+        }}
+        results = {'100': {
+            'calendar': {
+                # within the threshold, but slower at p95 and a query more.
+                'cold': {'p50_ms': 24, 'p95_ms': 60, 'queries': 4},
+                # no longer served from the cache.
+                'warm': {'p50_ms': 20, 'p95_ms': 30, 'queries': 3},
+            },
+            'campers': {
+                # twice as slow, by too little to tell.
+                'cold': {'p50_ms': 4, 'p95_ms': 6, 'queries': 6},
+                'warm': {'p50_ms': 4, 'p95_ms': 6, 'queries': 6},
+            },
+        }, '1000': {
+            'calendar': {
+                'cold': {'p50_ms': 200, 'p95_ms': 300, 'queries': 3},
+                'warm': {'p50_ms': 200, 'p95_ms': 300, 'queries': 3},
+            },
+        }}
+
+        self.assertEqual([
+            'calendar (cold) at 100 campers: p95_ms went from 30 to 60',
+            'calendar (cold) at 100 campers: queries went from 3 to 4',
+            'calendar (warm) at 100 campers: queries went from 2 to 3',
+        ], benchmark.compare(results, baseline, 0.25))
+
+        # too few requests to trust the timings.
+        self.assertEqual([
+            'calendar (cold) at 100 campers: queries went from 3 to 4',
+            'calendar (warm) at 100 campers: queries went from 2 to 3',
+        ], benchmark.compare(results, baseline, 0.25, repeat=3))
+
+    def test_plans(self):
+        meal = factories.MealFactory()
+        factories.MealShiftFactory(meal=meal)
+        factories.BikeMutationScheduleFactory(event=meal.event)
+
+        plans = benchmark.plans(meal.event, repeat=1)
+
+        self.assertEqual([name for name, queryset in
+            benchmark.hot_queries(meal.event)], list(plans))
+        for stats in plans.values():
+            self.assertTrue(stats['plan'])
+
+
+class GenerateCampTestCase(TestCase):
+    def _generate(self, **options):
+        call_command('generate_camp', campers=50, seed=1,
+            start=datetime.datetime(2030, 8, 21), days=12, stdout=StringIO(),
+            **options)
+        return Event.objects.get(name='Synthetic camp 1')
+
+    def test_generates_camp(self):
+        event = self._generate()
+
+        campers = User.objects.filter(username__startswith='synthetic-1-')
+        self.assertEqual(50, campers.count())
+        attendees = UserAttendance.objects.attendees(event)
+        self.assertTrue(0 < attendees.count() <= 50)
+        self.assertEqual(attendees.count(),
+            Shelter.objects.filter(event=event).count())
+        # founders sponsor the first wave, which sponsors the rest.
+        self.assertTrue(campers.filter(sponsor=None).exists())
+        self.assertFalse(campers.filter(sponsor__sponsor__sponsor__isnull=False
+            ).exists())
+        self.assertTrue(Meal.objects.filter(event=event).exists())
+        self.assertFalse(Meal.objects.filter(event=event).exclude(
+            shifts__role=MealShift.Chef).exists())
+        # bulk inserts send no signals, so the headcounts are rebuilt.
+        self.assertEqual(len(list(event.days)),
+            DailyHeadcount.objects.filter(event=event).count())
+
+    def test_refuses_to_run_twice(self):
+        self._generate()
+        with self.assertRaises(CommandError):
+            self._generate(name='Another synthetic camp')
+
+
+class EmailOrUsernameBackendTestCase(TestCase):
+    def setUp(self):
+        self.backend = EmailOrUsernameModelBackend()
+
+    def _user(self, **kwargs):
+        user = factories.UserFactory(**kwargs)
+        user.set_password('secret')
+        user.save()
+        return user
+
+    def test_username_or_email_in_any_case(self):
+        user = self._user(username='Sparkle', email='Sparkle@Example.com')
+
+        for login in ('sparkle', ' SPARKLE ', 'sparkle@example.com'):
+            self.assertEqual(user, self.backend.authenticate(None,
+                username=login, password='secret'))
+        self.assertIsNone(self.backend.authenticate(None, username='sparkle',
+            password='wrong'))
+        self.assertIsNone(self.backend.authenticate(None, username='nobody',
+            password='secret'))
+
+    def test_username_wins(self):
+        # one camper's email is another's username.
+        self._user(username='dusty', email='Moth')
+        user = self._user(username='moth')
+
+        self.assertEqual(user, self.backend.authenticate(None,
+            username='moth', password='secret'))
+
+    def test_one_query(self):
+        self._user(username='nova')
+
+        with self.assertNumQueries(1):
+            self.backend.authenticate(None, username='nova@example.com',
+                password='secret')
+
+    def test_shared_email(self):
+        self._user(username='pip', email='pickles@example.com')
+        self._user(username='quin', email='Pickles@example.com')
+
+        self.assertIsNone(self.backend.authenticate(None,
+            username='pickles@example.com', password='secret'))
+
+
+@view_settings
+class ClaimTestCase(TestCase):
+    def setUp(self):
+        self.meal = factories.MealFactory()
+        self.user = factories.UserFactory()
+        self.client.force_login(self.user)
+
+    def test_claim_and_release(self):
+        shift = factories.MealShiftFactory(meal=self.meal)
+
+        self.assertEqual(claims.CLAIMED, claims.claim_meal_shift(shift.pk, self.user))
+        self.assertEqual(claims.TAKEN,
+            claims.claim_meal_shift(shift.pk, factories.UserFactory()))
+        self.assertEqual(claims.NOT_YOURS,
+            claims.release_meal_shift(shift.pk, factories.UserFactory()))
+        self.assertEqual(claims.RELEASED, claims.release_meal_shift(shift.pk, self.user))
+        self.assertEqual(claims.NOT_FOUND, claims.claim_meal_shift(0, self.user))
+
+    def test_one_shift_per_meal(self):
+        first = factories.MealShiftFactory(meal=self.meal)
+        second = factories.MealShiftFactory(meal=self.meal)
+
+        self.assertEqual(claims.CLAIMED, claims.claim_meal_shift(first.pk, self.user))
+        self.assertEqual(claims.ALREADY_WORKING,
+            claims.claim_meal_shift(second.pk, self.user))
+        self.assertIsNone(MealShift.objects.get(pk=second.pk).worker)
+
+    def test_signup_views(self):
+        shift = factories.MealShiftFactory(meal=self.meal,
+            worker=factories.UserFactory())
+        url = reverse('worker_signup', kwargs={'shift_id': shift.pk})
+        # conflicts go back to the board, saying why.
+        response = self.client.post(url, {'action': 'claim'}, follow=True)
+        self.assertRedirects(response, reverse('meal_shifts'))
+        self.assertContains(response, views.CLAIM_CONFLICTS[claims.TAKEN])
+        response = self.client.post(url, {'action': 'release'}, follow=True)
+        self.assertContains(response, views.CLAIM_CONFLICTS[claims.NOT_YOURS])
+        self.assertEqual(404, self.client.post(url).status_code)
+        self.assertEqual(404, self.client.post(reverse('worker_signup',
+            kwargs={'shift_id': 0}), {'action': 'claim'}).status_code)
+
+        url = reverse('chef_signup', kwargs={'meal_id': self.meal.pk})
+        self.assertEqual(302, self.client.post(url, {'action': 'claim'}).status_code)
+        self.assertEqual(self.user, Meal.objects.get(pk=self.meal.pk).chef)
+        self.client.post(url, {'action': 'release'})
+        self.assertIsNone(Meal.objects.get(pk=self.meal.pk).chef)
+
+    def test_stale_signups_change_nothing(self):
+        shift = factories.MealShiftFactory(meal=self.meal)
+        url = reverse('worker_signup', kwargs={'shift_id': shift.pk})
+
+        # a second "Sign up" from a page shown before the first.
+        for i in range(2):
+            self.assertEqual(302, self.client.post(url, {'action': 'claim'}).status_code)
+            self.assertEqual(self.user, MealShift.objects.get(pk=shift.pk).worker)
+
+        self.client.post(url, {'action': 'release'})
+        self.assertEqual(302, self.client.post(url, {'action': 'release'}).status_code)
+        self.assertIsNone(MealShift.objects.get(pk=shift.pk).worker)
+
+
+@view_settings
+class ClaimBatchTestCase(TestCase):
+    def setUp(self):
+        self.user = factories.UserFactory()
+        self.client.force_login(self.user)
+        self.url = reverse('claim_shifts')
+
+    def test_batch(self):
+        self.maxDiff = None
+        meal = factories.MealFactory()
+        other_meal = factories.MealFactory(event=meal.event)
+        first, second = [factories.MealShiftFactory(meal=meal) for i in range(2)]
+        mine = factories.MealShiftFactory(meal=other_meal, worker=self.user)
+        swap = factories.MealShiftFactory(meal=other_meal)
+        taken = factories.MealShiftFactory(meal=other_meal,
+            worker=factories.UserFactory())
+        bike = factories.BikeMutationScheduleFactory(event=meal.event)
+
+        response = self.client.post(self.url, {
+            'claim_meal_shift': [first.pk, second.pk, swap.pk, taken.pk, 0, 'x'],
+            'release_meal_shift': [mine.pk],
+            'claim_bike_shift': [bike.pk],
+        })
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            'meal_shifts': {
+                str(first.pk): claims.CLAIMED,
+                str(second.pk): claims.ALREADY_WORKING,
+                str(swap.pk): claims.CLAIMED,
+                str(taken.pk): claims.TAKEN,
+                str(mine.pk): claims.RELEASED,
+                '0': claims.NOT_FOUND,
+                'x': claims.NOT_FOUND,
+            },
+            'bike_shifts': {str(bike.pk): claims.CLAIMED},
+        }, response.json())
+        self.assertEqual({first.pk, swap.pk}, set(MealShift.objects.filter(
+            worker=self.user).values_list('pk', flat=True)))
+        self.assertEqual(self.user,
+            BikeMutationSchedule.objects.get(pk=bike.pk).worker)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        meals = [factories.MealFactory() for i in range(10)]
+        shifts = [factories.MealShiftFactory(meal=meal) for meal in meals]
+
+        with CaptureQueriesContext(connection) as one:
+            self.client.post(self.url, {'claim_meal_shift': [shifts[0].pk]})
+        with CaptureQueriesContext(connection) as many:
+            self.client.post(self.url,
+                {'claim_meal_shift': [shift.pk for shift in shifts[1:]]})
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(10, MealShift.objects.filter(worker=self.user).count())
+
+
+class _FailingMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        raise ValueError("middleware failed")
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@view_settings
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('camp.instrumentation')
+        self.handler = _ListHandler()
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.WARNING)
+        self.logger.propagate = True
+
+    def test_logs_view_timings(self):
+        self.client.force_login(factories.UserFactory())
+        meal = factories.MealFactory(event=get_current_event())
+        factories.MealShiftFactory(meal=meal)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('meal_schedule'))
+
+        self.assertNotIn('Server-Timing', response)
+        logged = json.loads(self.handler.records[-1].getMessage())
+        self.assertEqual('meal_schedule', logged['view'])
+        self.assertEqual(len(ctx), logged['queries'])
+        self.assertEqual(instrumentation.SLOWEST_STATEMENTS, len(logged['slowest']))
+        self.assertGreater(logged['template_ms'], 0)
+
+    def test_server_timing_for_staff(self):
+        self.client.force_login(factories.UserFactory(is_staff=True))
+
+        # no debug cursor here, so connection.queries stays empty.
+        response = self.client.get(reverse('calendar'))
+
+        self.assertEqual([], connection.queries)
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        logged = json.loads(self.handler.records[-1].getMessage())
+        self.assertIn('%s queries' % logged['queries'], response['Server-Timing'])
+
+    def test_unwraps_cursors_after_errors(self):
+        user = factories.UserFactory()
+        failing = self.client_class()
+        failing.force_login(user)
+        with override_settings(MIDDLEWARE=settings.MIDDLEWARE
+                + ('camp.tests._FailingMiddleware',)):
+            with self.assertRaisesMessage(ValueError, "middleware failed"):
+                failing.get(reverse('calendar'))
+
+        self.assertNotIn('make_cursor', list(vars(connections['default'])))
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('calendar'))
+        logged = json.loads(self.handler.records[-1].getMessage())
+        self.assertEqual(len(ctx), logged['queries'])
+
+
+@view_settings
+class QueryBudgetTestCase(TestCase):
+    """
+    Every page's query count, at two sizes of camp. A count that grows
+    with the camp is an N+1 somewhere, and each page has its own budget.
+    """
+    SMALL = 20
+    LARGE = 200
+
+    # (url name, kwargs, method, data, budget), the budget being the most
+    # queries the page may take for a normal camper or for staff.
+    PAGES = [
+        ('index', {}, 'get', None, 5),
+        ('login', {}, 'get', None, 4),
+        ('password_reset', {}, 'get', None, 3),
+        ('password_change', {}, 'get', None, 3),
+        ('confirm', {}, 'get', None, 4),
+        ('django.contrib.flatpages.views.flatpage', {'url': 'budget/'}, 'get', None, 5),
+        ('profile', {}, 'get', None, 8),
+        ('vehicle', {}, 'get', None, 5),
+        ('shelter', {}, 'get', None, 5),
+        ('meal_shifts', {}, 'get', None, 10),
+        ('bikes', {}, 'get', None, 6),
+        ('edit_bike', {'bike_id': None}, 'get', None, 6),
+        ('meal_schedule', {}, 'get', None, 10),
+        ('inventory', {}, 'get', None, 5),
+        ('campers', {}, 'get', None, 8),
+        ('calendar', {}, 'get', None, 10),
+        ('bms_shifts', {}, 'get', None, 6),
+        ('bikemutation', {}, 'get', None, 5),
+        ('provider_search', {'kind': 'transit'}, 'get', {'term': 'first'}, 5),
+        ('provider_search', {'kind': 'shelter'}, 'get', {'term': 'first1'}, 5),
+        ('export', {}, 'get', None, 8),
+        ('export', {}, 'get', {'full': 1}, 13),
+        ('admin:index', {}, 'get', None, 6),
+        # each signup is sent twice, to claim and then release.
+        ('chef_signup', {'meal_id': None}, 'post', None, 4),
+        ('worker_signup', {'shift_id': None}, 'post', None, 5),
+        ('bms_worker_signup', {'shift_id': None}, 'post', None, 5),
+        ('claim_shifts', {}, 'post', 'claims', 15),
+        # the chef raises and then lowers what their own meal needs.
+        ('chef_requirements', {'meal_id': None}, 'post', 'requirements', 9),
+        # the item views each act on an item made for them.
+        ('remove_bike', {}, 'post', 'bike', 7),
+        ('remove_inventory', {}, 'post', 'item', 6),
+        ('edit_inventory', {}, 'post', 'item', 4),
+        ('remove_items_from_bikemutation', {}, 'post', 'material', 6),
+        ('edit_bikemutation', {}, 'post', 'material', 4),
+    ]
+
+    # pages that send a normal camper to the admin login instead.
+    STAFF_ONLY = ('edit_bike', 'remove_bike', 'export', 'admin:index')
+
+    # the POST pages that answer with a page rather than a redirect.
+    RENDERED = ('claim_shifts', 'remove_bike', 'remove_inventory',
+        'remove_items_from_bikemutation')
+
+    def setUp(self):
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+        self.restrictions = [factories.MealRestrictionFactory()
+            for i in range(3)]
+        FlatPage.objects.create(url='/budget/', title='Budget',
+            content='Within budget').sites.add(Site.objects.get_current())
+        self.camper = factories.UserFactory()
+        self.staff = factories.UserFactory(is_staff=True)
+        for user in (self.camper, self.staff):
+            factories.UserAttendanceFactory(user=user, event=self.event)
+        self.users = []
+
+    def _populate(self, size):
+        days = list(self.event.days)
+        kinds = [kind for kind, name in Meal.Kinds]
+        for i in range(len(self.users), size):
+            user = factories.UserFactory(
+                sponsor=self.users[-1] if self.users else None)
+            user.meal_restrictions.set(self.restrictions[:i % 3])
+            factories.UserAttendanceFactory(user=user, event=self.event)
+            riding = i % 4 == 3
+            factories.VehicleFactory(user=user, event=self.event,
+                transit_arrangement=RIDING_WITH if riding else DRIVING,
+                transit_provider=self.users[-1] if riding else None)
+            sharing = i % 3 == 2
+            factories.ShelterFactory(user=user, event=self.event,
+                sleeping_arrangement=sharing_someone_elses if sharing else bringing_own_tent,
+                shelter_provider=self.users[-1] if sharing else None)
+
+            if i % 5 == 0:
+                meal = factories.MealFactory(event=self.event,
+                    day=days[i // 5 % len(days)], kind=kinds[i // 5 % len(kinds)],
+                    chef=user)
+                factories.MealShiftFactory(meal=meal, role=MealShift.Chef)
+                for worker in self.users[-2:]:
+                    factories.MealShiftFactory(meal=meal, worker=worker)
+                factories.MealShiftFactory(meal=meal, role=MealShift.KP)
+            elif i % 5 == 1:
+                factories.BikeMutationScheduleFactory(event=self.event,
+                    date=days[i % len(days)], worker=user)
+            if i % 10 == 0:
+                factories.BikeFactory(bike_owner=user)
+                factories.InventoryFactory()
+                factories.BicycleMutationInventoryFactory()
+            self.users.append(user)
+
+        # what the signups act on, the same at every size.
+        self.open_meal = factories.MealFactory(event=self.event,
+            day=days[0], kind=Meal.Bartend)
+        self.open_shift = factories.MealShiftFactory(meal=self.open_meal)
+        self.open_bike_shift = factories.BikeMutationScheduleFactory(
+            event=self.event, date=days[0])
+        self.own_meals = {user.pk: factories.MealFactory(event=self.event,
+                day=days[1], kind=Meal.Bartend, chef=user)
+            for user in (self.camper, self.staff)}
+
+    def _status(self, name, method, data):
+        """
+        What a page should answer the logged in user with; anything else
+        would make its query count meaningless.
+        """
+        if name in self.STAFF_ONLY and not self.user.is_staff:
+            return 302
+        if method == 'post' and name not in self.RENDERED:
+            return 302
+        return 200
+
+    def _posts(self, name, data):
+        """
+        What a POST page is sent, in order. Whatever the page acts on is
+        made here, before its queries are counted.
+        """
+        if data == 'claims':
+            return [
+                {'claim_meal_shift': [self.open_shift.pk],
+                    'claim_bike_shift': [self.open_bike_shift.pk]},
+                {'release_meal_shift': [self.open_shift.pk],
+                    'release_bike_shift': [self.open_bike_shift.pk]},
+            ]
+        if data == 'requirements':
+            prefix = 'meal-%s-' % self.own_meal.pk
+            return [
+                {prefix + 'need_courier': 'on', prefix + 'number_of_sous': 2,
+                    prefix + 'number_of_kp': 3, prefix + 'public_notes': 'Stew'},
+                {prefix + 'number_of_sous': 0, prefix + 'number_of_kp': 0},
+            ]
+        if data == 'bike':
+            return [{'bike_id': factories.BikeFactory(bike_owner=self.user).pk}]
+        if data == 'item':
+            item = factories.InventoryFactory()
+            fields = {'item': 'tarp', 'quantity': 2} if name.startswith('edit') else {}
+            return [dict(fields, item_id=item.pk)]
+        if data == 'material':
+            material = factories.BicycleMutationInventoryFactory()
+            fields = ({'material': 'tube', 'quantity': 2, 'units': 'each'}
+                if name.startswith('edit') else {})
+            return [dict(fields, item_id=material.pk)]
+        # each signup is claimed and then released.
+        return [{'action': 'claim'}, {'action': 'release'}]
+
+    def _url(self, name, kwargs):
+        ids = {
+            'meal_id': self.open_meal.pk,
+            'shift_id': self.open_shift.pk,
+            'bike_id': Bike.objects.order_by('pk').values_list('pk', flat=True)[0],
+        }
+        if name == 'bms_worker_signup':
+            ids['shift_id'] = self.open_bike_shift.pk
+        elif name == 'chef_requirements':
+            ids['meal_id'] = self.own_meal.pk
+        return reverse(name, kwargs={key: ids[key] if value is None else value
+            for key, value in kwargs.items()})
+
+    def _request(self, name, url, method, data, posts):
+        if method == 'get':
+            responses = [self.client.get(url, data or {})]
+            if responses[0].streaming:
+                b''.join(responses[0].streaming_content)
+        else:
+            responses = [self.client.post(url, post) for post in posts]
+
+        status = self._status(name, method, data)
+        for response in responses:
+            self.assertEqual(status, response.status_code, '%s (staff=%s, %s)'
+                ' answered %s' % (name, self.user.is_staff, data,
+                    response.status_code))
+        return len(responses)
+
+    def _measure(self):
+        counts = {}
+        for user in (self.camper, self.staff):
+            self.user = user
+            self.own_meal = self.own_meals[user.pk]
+            self.client.force_login(user)
+            for name, kwargs, method, data, budget in self.PAGES:
+                url = self._url(name, kwargs)
+                posts = self._posts(name, data) if method == 'post' else None
+                # cold, so the counts don't depend on what ran before.
+                cache.clear()
+                with CaptureQueriesContext(connection) as ctx:
+                    requests = self._request(name, url, method, data, posts)
+                counts[user.is_staff, name, str(data)] = len(ctx) // requests
+        return counts
+
+    def test_budgets(self):
+        self._populate(self.SMALL)
+        # the first pass also pays for one-off work, like building the
+        # headcount table.
+        self._measure()
+        small = self._measure()
+        self._populate(self.LARGE)
+        large = self._measure()
+
+        budgets = {(name, str(data)): budget
+            for name, kwargs, method, data, budget in self.PAGES}
+        problems = []
+        for key in sorted(small):
+            staff, name, data = key
+            if small[key] != large[key]:
+                problems.append('%s (staff=%s, %s): %s queries at %s campers, '
+                    '%s at %s' % (name, staff, data, small[key], self.SMALL,
+                        large[key], self.LARGE))
+            elif large[key] > budgets[name, data]:
+                problems.append('%s (staff=%s, %s): %s queries, over its '
+                    'budget of %s' % (name, staff, data, large[key],
+                        budgets[name, data]))
+        self.assertEqual([], problems, '\n'.join(problems))
+
+
+class ConcurrentClaimTestCase(TransactionTestCase):
+    # threads each open their own connection, which can't see an in-memory
+    # sqlite test database; settings give sqlite a file-based one.
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("threads can't share an in-memory sqlite database")
+
+    def test_only_one_claim_wins(self):
+        shift = factories.MealShiftFactory()
+        users = [factories.UserFactory() for i in range(8)]
+        results = []
+
+        def claim(user):
+            try:
+                results.append(claims.claim_meal_shift(shift.pk, user))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, results.count(claims.CLAIMED))
+        self.assertEqual(len(users) - 1, results.count(claims.TAKEN))
+        self.assertIn(MealShift.objects.get(pk=shift.pk).worker, users)
+
+
+@view_settings
+class DataVersionTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = factories.EventFactory(
+            start_date=datetime.date(2019, 8, 20),
+            end_date=datetime.date(2019, 8, 27))
+        self.viewer = factories.UserFactory()
+        self.client.force_login(self.viewer)
+
+    def _version(self):
+        return versions.data_version(self.event)[0]
+
+    def test_conditional_get(self):
+        url = reverse('calendar')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304,
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        UserAttendance.objects.create(user=factories.UserFactory(),
+            event=self.event, camping_this_year=True,
+            arrival_date=_at(2019, 8, 21, 9), departure_date=_at(2019, 8, 24, 9))
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertEqual(1, response.context['counts_by_day'][1]['arriving'])
+
+    def test_etag_covers_session_and_csrf_cookie(self):
+        url = reverse('bms_shifts')
+        # the first answer sets the csrf cookie.
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(304,
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        # a new csrf cookie leaves the cached forms' tokens dead.
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'rotated'
+        self.assertEqual(200,
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        # and so does logging in again, with the same csrf cookie.
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.client.force_login(self.viewer)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'rotated'
+        self.assertEqual(200,
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_etag_covers_waiting_messages(self):
+        shift = factories.BikeMutationScheduleFactory(event=self.event,
+            worker=factories.UserFactory())
+        url = reverse('bms_shifts')
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+
+        self.client.post(reverse('bms_worker_signup', args=[shift.pk]),
+            {'action': 'claim'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, views.CLAIM_CONFLICTS[claims.TAKEN])
+
+    def test_bumps_once_per_transaction(self):
+        before = self._version()
+        with atomic():
+            meal = factories.MealFactory(event=self.event)
+            for i in range(3):
+                factories.MealShiftFactory(meal=meal)
+        self.assertEqual(before + 1, self._version())
+
+        try:
+            with atomic():
+                factories.MealFactory(event=self.event)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(before + 1, self._version())
+
+    def test_claims_bump(self):
+        meal_shift = factories.MealShiftFactory(meal=factories.MealFactory(
+            event=self.event))
+        bike_shift = factories.BikeMutationScheduleFactory(event=self.event)
+        other_event = factories.EventFactory()
+
+        before = self._version()
+        other_before = versions.data_version(other_event)[0]
+        claims.claim_meal_shift(meal_shift.pk, self.viewer)
+        claims.claim_bike_shift(bike_shift.pk, self.viewer)
+        self.assertEqual(before + 2, self._version())
+        self.assertEqual(other_before, versions.data_version(other_event)[0])
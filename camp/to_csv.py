@@ -1,42 +1,57 @@
-from cStringIO import StringIO
-from unicodecsv import writer
+from __future__ import absolute_import
+
 from camp import models
-from django.db.models import fields
+from camp.streaming import csv_chunks
 
-User
-    Vehicle
-    Shelter
-Meal
-    MealShift
+# User
+#     Vehicle
+#     Shelter
+# Meal
+#     MealShift
+DUMP_MODELS = [
+    models.User,
+    models.User.meal_restrictions.through,
+    models.UserAttendance,
+    models.Vehicle,
+    models.Shelter,
+    models.Meal,
+    models.MealShift,
+    models.Bike,
+    models.BicycleMutationInventory,
+    models.Inventory,
+]
 
+# never leaves the database.
+EXCLUDED_FIELDS = {
+    models.User: {'password'},
+}
 
-def local_fields(model):
-    for f in model._meta.get_fields():
-        if f.auto_created:
-            continue
 
-        if not f.is_relation:
-            yield f
-        elif f.related_model is not None:
+def local_fields(model):
+    excluded = EXCLUDED_FIELDS.get(model, set())
+    for f in model._meta.concrete_fields:
+        if f.name not in excluded:
             yield f
 
 def dump_model(model):
-    exists = model.objects.exists()
-    return exists, model.objects.values()
+    """
+    The column names and a lazy stream of row tuples for a model's table.
+
+    Rows come straight from values_list().iterator(), which reads through a
+    server-side cursor on PostgreSQL, so no model instances are built and
+    the table is never held in memory.
+    """
+    columns = [f.attname for f in local_fields(model)]
+    rows = model._default_manager.order_by('pk'
+        ).values_list(*columns).iterator()
+    return columns, rows
 
-def dump_models(models):
+def dump_models(archive, prefix, models=DUMP_MODELS):
+    """
+    Yield the bytes of one CSV member per model, written to a ZipStream.
+    """
     for model in models:
-        exists, rows = dump_model(model)
-        if not exists:
-            return []
-        keys = None
-        for row in rows:
-            if keys is None:
-                keys = sorted(row.keys())
-            yield dump_row(keys, row)
-
-def dump_row(keys, row):
-    ret = []
-    for key in keys:
-        ret.append(row[key])
-    return row
\ No newline at end of file
+        columns, rows = dump_model(model)
+        name = '%s/%s.csv' % (prefix, model._meta.db_table)
+        for data in archive.member(name, csv_chunks(columns, rows)):
+            yield data
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, connection
+from django.db.models import F, Q
+from django.db.transaction import atomic, on_commit
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .models import EventDataVersion
+from .shortcuts import get_current_event
+
+# Bumps made inside a transaction are gathered and applied once it commits,
+# so a change that touches many rows costs one UPDATE, and one that rolls
+# back costs none.
+_pending = threading.local()
+
+
+def _bump(everything, event_ids, meal_ids):
+    versions = EventDataVersion.objects.all()
+    if not everything:
+        versions = versions.filter(Q(event__in=event_ids) | Q(event__meal__in=meal_ids))
+    versions.update(version=F('version') + 1, changed=timezone.now())
+
+def _flush():
+    _bump(*_pending.changes)
+
+def data_changed(event_ids=None, meal_ids=()):
+    """
+    Bump the data version of the given events, and of the events of the
+    given meals. With neither, bump every event's: for changes that show on
+    all of them, like a camper's profile.
+    """
+    everything = event_ids is None and not meal_ids
+    event_ids, meal_ids = set(event_ids or ()), set(meal_ids)
+    if not connection.in_atomic_block:
+        _bump(everything, event_ids, meal_ids)
+        return
+
+    # a flush still waiting to run means this transaction has bumped before.
+    if not any(func is _flush for _, func in connection.run_on_commit):
+        _pending.changes = (False, set(), set())
+        on_commit(_flush)
+    pending_everything, pending_events, pending_meals = _pending.changes
+    _pending.changes = (pending_everything or everything,
+        pending_events | event_ids, pending_meals | meal_ids)
+
+def data_version(event):
+    """
+    (version, changed) for an event. Always read fresh, since the current
+    event itself is cached.
+    """
+    versions = EventDataVersion.objects.filter(event=event
+        ).values_list('version', 'changed')
+    try:
+        return versions.get()
+    except EventDataVersion.DoesNotExist:
+        pass
+    try:
+        with atomic():
+            EventDataVersion.objects.create(event=event)
+    except IntegrityError:
+        # someone else created it at the same time.
+        pass
+    return versions.get()
+
+def cache_key(event, version, *parts):
+    """
+    A cache key under an event's data version; bumping the version leaves
+    everything cached under the old one unread until it expires.
+    """
+    return 'camp:v:%s:%s:%s' % (event.pk, version, ':'.join(map(str, parts)))
+
+
+def request_data_version(request):
+    """
+    data_version() of the current event, read once per request.
+    """
+    if not hasattr(request, '_data_version'):
+        request._data_version = data_version(get_current_event())
+    return request._data_version
+
+def conditional_on_event(view):
+    """
+    Answer GETs of a view with 304 Not Modified while the current event's
+    data version is unchanged. The ETag also covers who is asking, since
+    the pages differ by viewer, and their session and csrf cookie, since
+    the pages' forms carry a csrf token that dies with either. Messages
+    waiting to be shown always get a fresh page.
+    """
+    def etag(request, *args, **kwargs):
+        version, changed = request_data_version(request)
+        user = request.user
+        secrets = hashlib.md5('%s:%s' % (request.session.session_key,
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME))).hexdigest()
+        return '%s-%s-%s-%d%d-%s-%d' % (view.__name__, version, user.pk,
+            user.is_staff, user.is_council, secrets,
+            len(messages.get_messages(request)))
+
+    def last_modified(request, *args, **kwargs):
+        version, changed = request_data_version(request)
+        return changed
+
+    return wraps(view)(condition(etag_func=etag,
+        last_modified_func=last_modified)(view))
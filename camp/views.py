@@ -1,17 +1,15 @@
 from __future__ import absolute_import
 
 import datetime
-import zipfile
-from cStringIO import StringIO
+import hashlib
 from collections import defaultdict
-from itertools import groupby
-
-import unicodecsv
+from itertools import chain, groupby
 
+from django.core.cache import cache
 from django.db.transaction import atomic
-from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponseRedirect, HttpResponse, Http404
+from django.http import (HttpResponseRedirect, HttpResponse,
+    JsonResponse, StreamingHttpResponse, Http404)
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import date
 from django.template.context_processors import csrf
@@ -22,14 +20,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.flatpages.models import FlatPage
 from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
 from django.views.generic.detail import SingleObjectMixin
 from django.contrib import messages
 
+from . import claims
 from .shortcuts import get_current_event
-from .models import (Event, Meal, MealShift, User, UserAttendance, Bike, Vehicle, Inventory, Shelter, BicycleMutationInventory, BikeMutationSchedule, Inventory,
-    BREAKFAST_TIME, DINNER_TIME)
+from .board import board
+from .schedule import build_calendar, DinerIndex
+from .streaming import ZipStream, csv_chunks, queryset_chunks
+from .to_csv import dump_models
+from .versions import cache_key, conditional_on_event, request_data_version
+from .models import (attach_attendance, attach_shelters, attach_vehicles, Event, Meal, MealShift, User, Bike, Vehicle, Inventory, Shelter, BicycleMutationInventory, BikeMutationSchedule, Inventory)
 from .forms import (UserProfileForm, UserAttendanceForm, VehicleForm,
-    UserForm, BikeForm, BikeMaterialForm, InventoryForm, ShelterForm, ChefForm)
+    UserForm, BikeForm, BikeMaterialForm, InventoryForm, ShelterForm, ChefForm,
+    PROVIDERS, search_providers)
 
 
 @login_required
@@ -49,76 +54,98 @@ def meal_shifts(request):
 
     base_coord = week_and_day(event.start_date)
 
-    meals = list(Meal.objects.filter(event=event
-        ).prefetch_related('shifts'))
-
     # arrange meals by day and by kind, into rows of weeks
     meals_by_day = []
 
-    for meal in meals:
-        raw_coord = week_and_day(meal.day)
+    for entry in board(event, request):
+        raw_coord = week_and_day(entry['day'])
         day = day_num(raw_coord, base_coord)
         while len(meals_by_day) <= day:
             meals_by_day.append([])
-        meals_for_day = meals_by_day[day]
-        meals_for_day.append(meal)
+        meals_by_day[day].append(entry)
 
     return render(request, 'meal_shifts.html',
         {'meals_by_day':meals_by_day})
 
-@login_required
-def chef_signup(request, meal_id):
+def _claim_or_release(request, claim, release, pk):
+    """
+    Run whichever of claim and release a signup form posts as its action.
+    Never a toggle, so a stale page can't undo what it shows.
+    """
     if request.method != 'POST':
         raise Http404
-    meal = get_object_or_404(Meal, pk=meal_id)
-    if meal.chef_id != request.user.id:
-        if meal.chef_id is not None:
-            raise Http404("A chef is already assigned to that meal")
-        # nobody is chef yet.
-        meal.chef = request.user
-    else:
-        # step down from the meal
-        meal.chef = None
-    meal.save()
-
-    return redirect('meal_shifts')
-
-def _maintain_role_requirement(meal, role, needed):
-    qs = MealShift.objects.filter(meal=meal, role=role)
-    existing = qs.count()
-
-    if existing == needed:
-        return
-    elif existing > needed:
-        extra = existing - needed
-        # prefer to get rid of unclaimed shifts.
-        unassigned_pks = qs.filter(worker__isnull=True
-            ).values_list('pk', flat=True)
-        if len(unassigned_pks) > extra:
-            # remove just some of the unassigned
-            unassigned_pks = unassigned_pks[:extra]
-        qs.filter(pk__in=unassigned_pks).delete()
-        extra -= len(unassigned_pks)
+    action = request.POST.get('action')
+    if action == 'claim':
+        return claim(pk, request.user)
+    elif action == 'release':
+        return release(pk, request.user)
+    raise Http404
+
+# what a camper is told, back on the signup page, when a claim or release
+# can't be done.
+CLAIM_CONFLICTS = {
+    claims.TAKEN: "Someone else already signed up for that.",
+    claims.ALREADY_WORKING: "You already have a shift at that meal; quit it first.",
+    claims.NOT_YOURS: "That is not yours to quit.",
+}
+
+def _after_signup(request, result, page):
+    if result == claims.NOT_FOUND:
+        raise Http404
+    if result in CLAIM_CONFLICTS:
+        messages.error(request, CLAIM_CONFLICTS[result])
+    return redirect(page)
 
+@login_required
+def chef_signup(request, meal_id):
+    result = _claim_or_release(request, claims.claim_chef,
+        claims.release_chef, meal_id)
+    return _after_signup(request, result, 'meal_shifts')
+
+def _maintain_role_requirements(meal, needed_by_role):
+    """
+    Add or remove the meal's shifts so each role has as many as needed.
+
+    All of the meal's shifts are read once and the differences applied with
+    one delete and one insert.
+    """
+    shifts_by_role = defaultdict(list)
+    for pk, role, worker_id in MealShift.objects.filter(meal=meal,
+            role__in=needed_by_role).order_by('pk').values_list('pk', 'role', 'worker'):
+        shifts_by_role[role].append((pk, worker_id))
+
+    to_delete = []
+    to_create = []
+    for role, needed in needed_by_role.items():
+        shifts = shifts_by_role[role]
+        extra = len(shifts) - needed
         if extra > 0:
-            # no choice but to delete assigned shifts. Do in order of PK,
-            # which is roughly signup order.
-            extra_pks = qs.order_by('-pk').values_list('pk', flat=True)[:extra]
-            qs.filter(pk__in=extra_pks).delete()
-    else: # existing < needed
-        for i in range(needed - existing):
-            MealShift.objects.create(meal=meal, role=role)
+            # prefer to get rid of unclaimed shifts.
+            unassigned = [pk for pk, worker_id in shifts if worker_id is None][:extra]
+            to_delete.extend(unassigned)
+            extra -= len(unassigned)
+
+            if extra > 0:
+                # no choice but to delete assigned shifts. Do in order of PK,
+                # which is roughly signup order.
+                assigned = [pk for pk, worker_id in shifts if pk not in unassigned]
+                to_delete.extend(assigned[-extra:])
+        elif extra < 0:
+            to_create.extend(MealShift(meal=meal, role=role)
+                for i in range(-extra))
+
+    if to_delete:
+        MealShift.objects.filter(pk__in=to_delete).delete()
+    if to_create:
+        MealShift.objects.bulk_create(to_create)
 
 def _maintain_meal_requirements(meal, chef_form):
     # generate or remove shifts as required.
-    need = 1 if chef_form.cleaned_data['need_courier'] else 0
-    _maintain_role_requirement(meal, MealShift.Courier, need)
-
-    _maintain_role_requirement(meal, MealShift.Sous_Chef,
-        int(chef_form.cleaned_data['number_of_sous']))
-
-    _maintain_role_requirement(meal, MealShift.KP,
-        int(chef_form.cleaned_data['number_of_kp']))
+    _maintain_role_requirements(meal, {
+        MealShift.Courier: 1 if chef_form.cleaned_data['need_courier'] else 0,
+        MealShift.Sous_Chef: int(chef_form.cleaned_data['number_of_sous']),
+        MealShift.KP: int(chef_form.cleaned_data['number_of_kp']),
+    })
 
     meal.private_notes = chef_form.cleaned_data['private_notes']
     meal.public_notes = chef_form.cleaned_data['public_notes']
@@ -144,26 +171,9 @@ def chef_requirements(request, meal_id):
 
 @login_required
 def worker_signup(request, shift_id):
-    if request.method != 'POST':
-        raise Http404
-    shift = get_object_or_404(MealShift, pk=shift_id)
-
-    if shift.worker_id != request.user.id:
-        if shift.worker_id is not None:
-            raise ValueError("A worker is already working that shift.")
-        # nobody is signed up yet.
-        with atomic():
-            # you can only work one shift per meal.
-            shift.meal.shifts.filter(worker=request.user
-                ).update(worker=None)
-            shift.worker = request.user
-            shift.save()
-    else:
-        # step down from the shift.
-        shift.worker = None
-        shift.save()
-
-    return redirect('meal_shifts')
+    result = _claim_or_release(request, claims.claim_meal_shift,
+        claims.release_meal_shift, shift_id)
+    return _after_signup(request, result, 'meal_shifts')
 
 def index(request):
     home_content = FlatPage.objects.get(title='homepage')
@@ -190,6 +200,7 @@ def login(request):
     return render(request, 'login.html')
 
 @login_required
+@conditional_on_event
 def campers(request):
     event = get_current_event()
     campers = User.objects.prefetch_related('meal_restrictions')
@@ -198,34 +209,16 @@ def campers(request):
         campers = campers.filter(userattendance__event=event,
             userattendance__camping_this_year=True)
 
+    campers = attach_attendance(campers, event)
     for camper in campers:
         camper.restrictions = ", ".join(map(str, camper.meal_restrictions.all())) or "None"
 
     return render(request, 'campers.html', {'campers': campers})
 
 
-def _initial_meal(meal):
-    attendees = UserAttendance.objects.attendees()
-
-    attendees_that_day = attendees.filter(
-        arrival_date__lte=meal.day,  departure_date__gte=meal.day
-        ).values_list('user', flat=True)
-
-    people_that_day = User.objects.filter(pk__in=attendees_that_day
-        ).prefetch_related('meal_restrictions')
-
-    other_restrictions = []
-    people_by_restriction = defaultdict(list)
-    for camper in people_that_day:
-        if camper.other_restrictions:
-            other_restrictions.append(camper.other_restrictions)
-        for restriction in camper.meal_restrictions.all():
-            people_by_restriction[restriction.name].append(camper.display_name)
-    if other_restrictions:
-        other_restrictions = ", ".join(other_restrictions)
-
-    for restriction in people_by_restriction:
-        people_by_restriction[restriction].sort()
+def _initial_meal(meal, diner_index):
+    people_by_restriction, other_restrictions, num_served = \
+        diner_index.summary(meal.day)
 
     positions = {
         role_display: []
@@ -241,24 +234,19 @@ def _initial_meal(meal):
         'positions': positions,
         'restrictions': people_by_restriction, # fixme - reformat for sorting: [{'restriction':x, people:[]}]
         'other_restrictions': other_restrictions,
-        'num_served': people_that_day.count()
+        'num_served': num_served
     }
 
 @login_required
+@conditional_on_event
 def meal_schedule(request):
     # FIXME: maybe urls should include the event they are related to?
     event = get_current_event()
 
-    # prod data is doing 55 queries here, but can get to 2x query per meal by:
-    # FIXME: hoist meal restrictions up (map people to restrictions)
-    # FIXME: hoist presence up (map day to people)
-
-    # from django.db import connections
-    # conn = connections['default']
-    # start_q = len(conn.queries)
+    diner_index = DinerIndex(event)
     shifts_by_meal = []
     for meal in Meal.objects.filter(event=event).select_related('chef').prefetch_related('shifts__worker'):
-        meal_summary = _initial_meal(meal)
+        meal_summary = _initial_meal(meal, diner_index)
 
         for shift in meal.shifts.all():
             if shift.role != MealShift.Chef:
@@ -267,13 +255,7 @@ def meal_schedule(request):
         shifts_by_meal.append(meal_summary)
 
     context_dict = {'shifts_by_meal': shifts_by_meal}
-    # view_q = len(conn.queries) - start_q
-    ret = render(request, "meal_schedule.html", context_dict)
-    # temp_q = len(conn.queries) - view_q
-    # print view_q, temp_q
-    # for q in conn.queries[start_q:]:
-    #     print q['sql']
-    return ret
+    return render(request, "meal_schedule.html", context_dict)
 
 
 @login_required
@@ -301,8 +283,9 @@ def profile(request):
 
 @login_required
 def vehicle(request):
+    event = get_current_event()
     try:
-        instance = Vehicle.objects.get(user=request.user)
+        instance = Vehicle.objects.get(user=request.user, event=event)
     except Vehicle.DoesNotExist:
         instance = None
 
@@ -313,6 +296,7 @@ def vehicle(request):
         if form.is_valid():
             vehicle = form.save(commit=False)
             vehicle.user = request.user
+            vehicle.event = event
             vehicle.save()
 
             return redirect('vehicle')
@@ -320,10 +304,42 @@ def vehicle(request):
     return render(request, "vehicle.html", {'form': form, 'profile': profile})
 
 
+PROVIDER_SEARCH_RESULTS = 10
+# results are shared under the event's data version, and browsers may
+# reuse them for a minute before revalidating.
+PROVIDER_SEARCH_CACHE_SECONDS = 60 * 60
+PROVIDER_SEARCH_MAX_AGE = 60
+
+@login_required
+@cache_control(private=True, max_age=PROVIDER_SEARCH_MAX_AGE)
+@conditional_on_event
+def provider_search(request, kind):
+    """
+    Who you could ride with or share a shelter with, for the provider
+    search boxes: {'results': [{'id', 'label'}]} for the term in ?term.
+    """
+    if kind not in PROVIDERS:
+        raise Http404
+    term = request.GET.get('term', '').strip().lower()
+
+    event = get_current_event()
+    version, changed = request_data_version(request)
+    key = cache_key(event, version, 'providers', kind,
+        hashlib.md5(term.encode('utf-8')).hexdigest())
+    results = cache.get(key)
+    if results is None:
+        # one extra, in case the one asking is among them.
+        results = search_providers(kind, event, term, PROVIDER_SEARCH_RESULTS + 1)
+        cache.set(key, results, PROVIDER_SEARCH_CACHE_SECONDS)
+
+    results = [r for r in results if r['id'] != request.user.pk]
+    return JsonResponse({'results': results[:PROVIDER_SEARCH_RESULTS]})
+
 @login_required
 def shelter(request):
+    event = get_current_event()
     try:
-        shelter = Shelter.objects.get(user=request.user)
+        shelter = Shelter.objects.get(user=request.user, event=event)
     except Shelter.DoesNotExist:
         shelter = None
 
@@ -333,6 +349,7 @@ def shelter(request):
         if form.is_valid():
             shelter = form.save(commit=False)
             shelter.user = request.user
+            shelter.event = event
             shelter.save()
 
             return redirect('shelter')
@@ -343,7 +360,7 @@ def shelter(request):
 def remove_bike(request):
     if request.method == 'POST':
         form = BikeForm()
-        bicycles = Bike.objects.all()
+        bicycles = Bike.objects.select_related('bike_owner')
         bike_id = int(request.POST.get('bike_id'))
         bike = Bike.objects.get(id=bike_id)
         bike.delete()
@@ -369,7 +386,7 @@ def edit_bike(request, bike_id):
 
 @login_required
 def show_bike_form(request):
-    bicycles = Bike.objects.all()
+    bicycles = Bike.objects.select_related('bike_owner')
 
     if request.method == "POST":
         form = BikeForm(data = request.POST)
@@ -402,11 +419,8 @@ def remove_items_from_bikemutation(request):
 def edit_bikemutation(request):
     materials= BicycleMutationInventory.objects.all()
 
-    item_id = int(
-        request.POST.get('item_id',
-            request.GET.get('item_id')))
-
-    item = int(request.POST.get('item_id'))
+    item_id = request.POST.get('item_id', request.GET.get('item_id'))
+    item = get_object_or_404(BicycleMutationInventory, pk=item_id)
 
     form = BikeMaterialForm(instance=item)
 
@@ -457,10 +471,8 @@ def remove_items_from_truck(request):
 def edit_truck_inventory(request):
     truck_inventory = Inventory.objects.all()
 
-    item_id = int(
-        request.POST.get('item_id', request.GET.get('item_id')))
-
-    item = int(request.POST.get('item_id'))
+    item_id = request.POST.get('item_id', request.GET.get('item_id'))
+    item = get_object_or_404(Inventory, pk=item_id)
 
     form = InventoryForm(instance=item)
 
@@ -526,89 +538,71 @@ def register(request):
 
 @login_required
 def bms_worker_signup(request, shift_id):
-    if request.method != 'POST':
-        raise Http404
+    result = _claim_or_release(request, claims.claim_bike_shift,
+        claims.release_bike_shift, shift_id)
+    return _after_signup(request, result, 'bms_shifts')
 
-    shift = get_object_or_404(BikeMutationSchedule, pk=shift_id)
 
-    if shift.worker is None:
-        shift.worker = request.user
-        shift.save()
-        return redirect('bms_shifts')
+def _posted_ids(request, name):
+    ids, invalid = [], []
+    for value in request.POST.getlist(name):
+        try:
+            ids.append(int(value))
+        except ValueError:
+            invalid.append(value)
+    return ids, invalid
 
-    if shift.worker != request.user:
+@login_required
+def claim_shifts(request):
+    """
+    Claim and release any number of meal and bike shifts in one POST.
+
+    Takes lists of ids in claim_meal_shift, release_meal_shift,
+    claim_bike_shift and release_bike_shift, and answers with the result
+    for each id, keyed by meal_shifts and bike_shifts. base.js posts here
+    the shifts marked on the shift boards.
+    """
+    if request.method != 'POST':
         raise Http404
-    else:
-        shift.worker = None
-        shift.save()
 
-        return redirect('bms_shifts')
+    posted = {}
+    results = {'meal_shifts': {}, 'bike_shifts': {}}
+    for kind, prefix in (('meal_shifts', 'meal_shift'), ('bike_shifts', 'bike_shift')):
+        for action in ('claim', 'release'):
+            ids, invalid = _posted_ids(request, '%s_%s' % (action, prefix))
+            posted['%s_%s' % (action, kind)] = ids
+            results[kind].update((value, claims.NOT_FOUND) for value in invalid)
+
+    for kind, by_pk in claims.claim_batch(request.user, **posted).items():
+        results[kind].update((str(pk), result) for pk, result in by_pk.items())
+
+    return JsonResponse(results)
 
 
 @login_required
+@conditional_on_event
 def bms_shifts(request):
     event = get_current_event()
     shifts = BikeMutationSchedule.objects.filter(
-        event=event).order_by('date', '-shift', 'id')
+        event=event).select_related('worker').order_by('date', '-shift', 'id')
 
     return render(request, 'bikemutationsignup.html', {'shifts': shifts})
 
-def transition_counts(prefix, qs):
-    return {
-        prefix: qs.count(),
-        prefix + '_breakfast': qs.filter(arrival_date__hour__lte=BREAKFAST_TIME).count(),
-        prefix + '_dinner': qs.filter(
-            arrival_date__hour__gt=BREAKFAST_TIME,
-            arrival_date__hour__lte=DINNER_TIME).count(),
-        prefix + '_late': qs.filter(arrival_date__hour__gt=DINNER_TIME).count()
-    }
+# cached under the event's data version, so changes never wait this long.
+CALENDAR_CACHE_SECONDS = 60 * 60
 
 @login_required
+@conditional_on_event
 def calendarview(request):
-    # FIXME: DRY
-    # campers present and meal restrictions
+    # the same for everyone, so shared until the event's data changes.
     event = get_current_event()
-
-    days = list(event.days)
-    counts_by_day = []
-    meals_by_day = []
-
-    bike_shifts_by_day = []
-
-    attendees = UserAttendance.objects.attendees()
-    for day in days:
-        arriving = attendees.filter(arrival_date__date=day)
-        departing = attendees.filter(departure_date__date=day)
-
-
-        unconfirmed_criteria = Q(departure_date__isnull=True) | Q(arrival_date__isnull=True)
-        unconfirmed = attendees.filter(unconfirmed_criteria).count()
-        staying = attendees.exclude(unconfirmed_criteria
-            ).exclude(arrival_date__date__gte=day
-            ).exclude(departure_date__date__lte=day).count()
-
-        day_counts = {
-            'staying': staying,
-            'unconfirmed': unconfirmed
-        }
-        day_counts.update(transition_counts('arriving', arriving))
-        day_counts.update(transition_counts('departing', departing))
-
-        counts_by_day.append(day_counts)
-
-        meals_by_day.append(Meal.objects.filter(
-            day=day).order_by(
-            'kind').prefetch_related('shifts__worker'))
-
-        bike_shifts_by_day.append(BikeMutationSchedule.objects.filter(
-            date=day, worker__isnull=False))
-
-    return render(request, 'calendar.html', {
-        'days': days,
-        'counts_by_day': counts_by_day,
-        'meals_by_day': meals_by_day,
-        'bike_shifts_by_day': bike_shifts_by_day
-    })
+    version, changed = request_data_version(request)
+    key = cache_key(event, version, 'calendar')
+    context = cache.get(key)
+    if context is None:
+        context = build_calendar(event)
+        cache.set(key, context, CALENDAR_CACHE_SECONDS)
+    return render(request, 'calendar.html', context)
 
 
 def _user_to_row(user):
@@ -647,6 +641,24 @@ def _user_to_row(user):
 
     return row
 
+EXPORT_CHUNK_SIZE = 500
+
+def _export_user_rows(num_fields):
+    # everything _user_to_row touches, so rows cost no further queries.
+    event = get_current_event()
+    users = User.objects.all().prefetch_related('meal_restrictions'
+        ).select_related('sponsor')
+    # in User's own order, as the export always was.
+    for chunk in queryset_chunks(users, EXPORT_CHUNK_SIZE,
+            ordering=User._meta.ordering):
+        attach_vehicles(chunk, event)
+        attach_shelters(chunk, event)
+        for user in attach_attendance(chunk, event):
+            row = _user_to_row(user)
+            if len(row) != num_fields:
+                raise ValueError("row length mismatch")
+            yield row
+
 @staff_member_required
 def export(request):
     # User
@@ -669,24 +681,18 @@ def export(request):
         ]
 
 
-    user_csv = StringIO()
-    writer = unicodecsv.writer(user_csv)
-    writer.writerow(user_fields)
-
-    users = User.objects.all().prefetch_related('meal_restrictions').select_related('vehicle', 'shelter')
-    for user in users:
-        row = _user_to_row(user)
-        if len(row) != len(user_fields):
-            raise ValueError("row length mismatch")
-        writer.writerow(row)
-    user_csv.seek(0)
-
-    dest = StringIO()
     date_rel = datetime.datetime.utcnow().strftime('%Y-%m-%d')
-    with zipfile.ZipFile(file=dest, mode='w', compression=zipfile.ZIP_DEFLATED) as z:
-        z.writestr('%s/user.csv' % date_rel, user_csv.read())
+    archive = ZipStream()
+    if request.GET.get('full'):
+        # every table, as stored
+        members = dump_models(archive, date_rel)
+        filename = 'bioluminati-full-%s.zip' % date_rel
+    else:
+        members = archive.member('%s/user.csv' % date_rel,
+            csv_chunks(user_fields, _export_user_rows(len(user_fields))))
+        filename = 'bioluminati-%s.zip' % date_rel
 
-    dest.seek(0)
-    response = HttpResponse(dest.read(), content_type="application/zip")
-    response['Content-Disposition'] = 'attachment; filename="bioluminati-%s.zip"' % date_rel
+    response = StreamingHttpResponse(chain(members, archive.close()),
+        content_type="application/zip")
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
     return response
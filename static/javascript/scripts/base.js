@@ -11,6 +11,72 @@ $(document).ready(function () {
 		console.log("clicked");
 	});
 
+	// provider search boxes fill the hidden input before them with the
+	// chosen camper's id.
+	$('.provider-search').each(function () {
+		var search = $(this);
+		var chosen = search.prev('input[type=hidden]');
+		search.autocomplete({
+			source: function (request, response) {
+				$.getJSON(search.data('url'), {term: request.term}, function (data) {
+					response(data.results);
+				});
+			},
+			select: function (event, ui) {
+				chosen.val(ui.item.id);
+			},
+			change: function (event, ui) {
+				// typed over the choice without picking anyone.
+				if (!ui.item) {
+					chosen.val('');
+				}
+			}
+		});
+	});
+
+	// the signup buttons on the shift boards mark shifts instead of posting
+	// one at a time; saving claims and releases all of them in one request.
+	var claimForm = $('#claim-shifts');
+	$('form.shift-claim').submit(function (event) {
+		event.preventDefault();
+		$(this).toggleClass('pending');
+		claimForm.toggleClass('hidden', $('form.shift-claim.pending').length == 0);
+	});
+
+	claimForm.submit(function (event) {
+		event.preventDefault();
+		var data = claimForm.serializeArray();
+		$('form.shift-claim.pending').each(function () {
+			data.push({name: $(this).data('field'), value: $(this).data('shift')});
+		});
+		$.post(claimForm.attr('action'), $.param(data)).done(function (results) {
+			var failed = 0;
+			$.each(results, function (kind, byId) {
+				$.each(byId, function (id, result) {
+					if (result != 'claimed' && result != 'released') {
+						failed++;
+					}
+				});
+			});
+			if (failed) {
+				alert(failed + " of your changes couldn't be made; someone may have got there first.");
+			}
+			$('form.shift-claim.pending').removeClass('pending');
+			window.location.reload();
+		}).fail(function (xhr) {
+			// the shifts stay marked, so saving can be tried again.
+			alert("Your signups couldn't be saved (error " + xhr.status + "). " +
+				"Please try again, or reload the page if it keeps happening.");
+		});
+	});
+
+	// marked shifts are only signed up for once saved.
+	$(window).on('beforeunload', function () {
+		if ($('form.shift-claim.pending').length) {
+			return "You have shift signups that aren't saved yet.";
+		}
+	});
+
 	function getCookie(name) {
 	var cookieValue = null;
 	if (document.cookie && document.cookie != '') {